@@ -0,0 +1,146 @@
+# chunked_pipeline.py
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from cup_and_handle_pattern_recognition import (
+    DEFAULT_CUP_AND_HANDLE_PARAMS,
+    label_with_structures,
+    precompute_window_structures,
+)
+
+DEFAULT_MEMORY_LIMIT = 256 * 1024 ** 2  # 256 MiB of working arrays per chunk
+
+
+def window_memory_bytes(window_size, params=DEFAULT_CUP_AND_HANDLE_PARAMS):
+    """
+    Estimate the working memory one window needs while it is labelled and preprocessed.
+
+    Parameters:
+    - window_size (int): Size of the window.
+    - params (CupAndHandleParams): Detector thresholds.
+
+    Returns:
+    - bytes (int): Bytes per window.
+    """
+    longest_handle = max(1, min(params.max_handle_length - 1, window_size - 1))
+    # Close prices, prefix minima, prefix argmin, features and temporaries, plus the handle max/min tables
+    return 8 * window_size * (6 + 2 * longest_handle)
+
+
+def chunk_size_for_memory(window_size, max_memory_bytes=DEFAULT_MEMORY_LIMIT, params=DEFAULT_CUP_AND_HANDLE_PARAMS):
+    """
+    Number of windows per chunk that keeps the working arrays under max_memory_bytes.
+    """
+    per_window = window_memory_bytes(window_size, params)
+    if max_memory_bytes < per_window:
+        raise ValueError(f"A memory limit of {max_memory_bytes} bytes is below the {per_window} bytes one window needs.")
+    return max_memory_bytes // per_window
+
+
+def iter_window_chunks(data, window_size=60, max_memory_bytes=DEFAULT_MEMORY_LIMIT,
+                       params=DEFAULT_CUP_AND_HANDLE_PARAMS, label_column='Close', feature_column='Adj Close'):
+    """
+    Label and preprocess the windows of a long series in bounded-memory chunks.
+
+    The series is read in blocks that overlap by window_size - 1 bars, so every window is
+    produced exactly once and the output matches label_windows and preprocess_windows run
+    on create_windows(data, window_size). No per-window DataFrames are created.
+
+    Parameters:
+    - data (DataFrame or ndarray): Price series; a structured or memory-mapped array (e.g.
+      from IntradayArchive.load(..., as_frame=False)) works as well as a DataFrame.
+    - window_size (int): Size of the window.
+    - max_memory_bytes (int): Ceiling on the working arrays held for one chunk.
+    - params (CupAndHandleParams): Detector thresholds.
+    - label_column (str): Column the detector runs on.
+    - feature_column (str): Column that is normalised into the CNN features.
+
+    Yields:
+    - start (int): Index of the chunk's first window.
+    - labels (ndarray): Labels of the chunk's windows.
+    - X (ndarray): Preprocessed windows of shape (windows, window_size, 1).
+    """
+    # np.asarray keeps memory-mapped columns mapped; only each block's bars are read
+    label_prices = np.asarray(data[label_column])
+    feature_prices = np.asarray(data[feature_column])
+    num_windows = len(label_prices) - window_size + 1
+    chunk_windows = chunk_size_for_memory(window_size, max_memory_bytes, params)
+
+    for start in range(0, max(num_windows, 0), chunk_windows):
+        stop = min(start + chunk_windows, num_windows)
+        # Bars [start, stop + window_size - 1) hold windows start..stop-1; consecutive blocks share window_size - 1 bars
+        block = slice(start, stop + window_size - 1)
+        label_windows_block = sliding_window_view(np.asarray(label_prices[block], dtype='float64'), window_size)
+        feature_windows_block = sliding_window_view(np.asarray(feature_prices[block], dtype='float64'), window_size)
+
+        structures = precompute_window_structures(label_windows_block, params.max_handle_length)
+        labels = label_with_structures(structures, params)
+        del structures
+
+        X = (feature_windows_block - feature_windows_block.mean(axis=1, keepdims=True)) / feature_windows_block.std(axis=1, keepdims=True)
+        yield start, labels, X.reshape((X.shape[0], X.shape[1], 1))
+
+
+def write_window_chunks(data, features_path, labels_path, window_size=60, max_memory_bytes=DEFAULT_MEMORY_LIMIT,
+                        params=DEFAULT_CUP_AND_HANDLE_PARAMS, label_column='Close', feature_column='Adj Close',
+                        dtype='float64'):
+    """
+    Stream the labels and preprocessed windows of a long series to .npy files chunk by chunk.
+
+    Chunks are appended with plain file writes rather than through a memory map, so written
+    windows don't stay resident; the files can be read back with np.load(path, mmap_mode='r')
+    for training without loading them whole.
+
+    Parameters:
+    - data (DataFrame or ndarray): Price series (see iter_window_chunks).
+    - features_path (str): Output .npy path for X, shape (windows, window_size, 1).
+    - labels_path (str): Output .npy path for the labels.
+    - window_size (int): Size of the window.
+    - max_memory_bytes (int): Ceiling on the working arrays held for one chunk.
+    - params (CupAndHandleParams): Detector thresholds.
+    - label_column (str): Column the detector runs on.
+    - feature_column (str): Column that is normalised into the CNN features.
+    - dtype (str): Feature dtype on disk; 'float32' halves the file size.
+
+    Returns:
+    - num_windows (int): Number of windows written.
+    - positives (int): Number of windows labelled as a pattern.
+    """
+    num_windows = max(len(data[label_column]) - window_size + 1, 0)
+
+    positives = 0
+    with open(features_path, 'wb') as X_file, open(labels_path, 'wb') as labels_file:
+        _write_npy_header(X_file, dtype, (num_windows, window_size, 1))
+        _write_npy_header(labels_file, 'int64', (num_windows,))
+        chunks = iter_window_chunks(data, window_size, max_memory_bytes, params, label_column, feature_column)
+        for start, labels, X in chunks:
+            X_file.write(X.astype(dtype, copy=False).tobytes())
+            labels_file.write(labels.astype('int64', copy=False).tobytes())
+            positives += int(labels.sum())
+
+    return num_windows, positives
+
+
+def _write_npy_header(f, dtype, shape):
+    """
+    Write a .npy header so raw C-order data appended after it loads with np.load.
+    """
+    header = {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False, 'shape': shape}
+    np.lib.format.write_array_header_1_0(f, header)
+
+if __name__ == '__main__':
+    from intraday_archive import IntradayArchive
+
+    ticker = input("Enter the ticker symbol of an archived intraday series (e.g., SPY): ").upper()
+    interval = input("Enter the interval (e.g., 1m): ")
+
+    bars = IntradayArchive().load(ticker, interval, as_frame=False)
+    if bars is None:
+        print(f"No archived {interval} bars for {ticker}.")
+    else:
+        # Archived bars carry no adjusted close, so the features use the close as well
+        num_windows, positives = write_window_chunks(
+            bars, f"{ticker}_{interval}_X.npy", f"{ticker}_{interval}_labels.npy", feature_column='Close', dtype='float32'
+        )
+        print(f"Wrote {num_windows} windows ({positives} patterns) to {ticker}_{interval}_X.npy and {ticker}_{interval}_labels.npy.")
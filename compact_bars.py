@@ -0,0 +1,213 @@
+# compact_bars.py
+
+import numpy as np
+import pandas as pd
+
+from intraday_archive import index_to_utc_nanoseconds
+
+TRADE_ACTIONS = ('buy', 'sell')
+TRADE_REASONS = ('buy_signal', 'stop_loss', 'profit_target')
+
+# One trade: time in UTC nanoseconds, action and reason as indexes into TRADE_ACTIONS / TRADE_REASONS
+TRADE_DTYPE = np.dtype([
+    ('time', '<i8'),
+    ('action', 'u1'),
+    ('reason', 'u1'),
+    ('shares', '<f8'),
+    ('price', '<f8'),
+])
+
+
+class CompactBars:
+    """
+    Columnar bar container: one int64 array of UTC epoch nanoseconds plus one float32 array
+    per column. Roughly half the resident memory of a float64 DataFrame, and hot loops can
+    index the column arrays directly. This is the form bars are held in between downloads,
+    the feature store and the backtest; convert with to_frame() only where pandas is needed,
+    e.g. for charts and tables.
+    """
+
+    __slots__ = ('timestamps', 'columns', 'tz')
+
+    def __init__(self, timestamps, columns, tz=None):
+        self.timestamps = np.asarray(timestamps, dtype='int64')
+        self.columns = columns
+        self.tz = tz
+
+    @classmethod
+    def from_frame(cls, data, columns=None):
+        """
+        Build compact bars from a price frame.
+
+        Parameters:
+        - data (DataFrame): Bars with a DatetimeIndex.
+        - columns (list, optional): Numeric columns to keep. Defaults to all numeric columns.
+
+        Returns:
+        - bars (CompactBars): The compact bars.
+        """
+        if columns is None:
+            columns = [column for column in data.columns if pd.api.types.is_numeric_dtype(data[column])]
+        tz = str(data.index.tz) if data.index.tz is not None else None
+        timestamps = index_to_utc_nanoseconds(data.index)
+        return cls(timestamps, {str(column): data[column].to_numpy(dtype='float32') for column in columns}, tz)
+
+    @classmethod
+    def from_array(cls, array, tz=None):
+        """
+        Build compact bars from a structured array with a 'timestamp' field, e.g. a memory
+        map of the feature store. The values are copied, so the map can be released.
+
+        Parameters:
+        - array (ndarray): Structured array of bars.
+        - tz (str, optional): Time zone of the bars.
+
+        Returns:
+        - bars (CompactBars): The compact bars.
+        """
+        columns = {name: np.array(array[name], dtype='float32') for name in array.dtype.names if name != 'timestamp'}
+        return cls(np.array(array['timestamp']), columns, tz)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def __setitem__(self, column, values):
+        self.columns[column] = np.asarray(values, dtype='float32')
+
+    def __contains__(self, column):
+        return column in self.columns
+
+    @property
+    def nbytes(self):
+        return self.timestamps.nbytes + sum(values.nbytes for values in self.columns.values())
+
+    def index(self):
+        """
+        DatetimeIndex of the bars, in the original time zone.
+        """
+        index = pd.DatetimeIndex(self.timestamps.view('datetime64[ns]'))
+        return index if self.tz is None else index.tz_localize('UTC').tz_convert(self.tz)
+
+    def time(self, position):
+        """
+        Timestamp of one bar, in the original time zone.
+        """
+        timestamp = pd.Timestamp(int(self.timestamps[position]))
+        return timestamp if self.tz is None else timestamp.tz_localize('UTC').tz_convert(self.tz)
+
+    def slice(self, start=None, stop=None):
+        """
+        Bars [start, stop) as views into the same arrays. Columns set on the slice are not
+        added to the original.
+        """
+        rows = slice(start, stop)
+        return CompactBars(self.timestamps[rows], {column: values[rows] for column, values in self.columns.items()}, self.tz)
+
+    def since(self, timedelta):
+        """
+        Bars no older than timedelta before the last bar, as views into the same arrays.
+        """
+        if len(self) == 0:
+            return self
+        cutoff = self.timestamps[-1] - pd.Timedelta(timedelta).value
+        return self.slice(int(np.searchsorted(self.timestamps, cutoff, side='left')))
+
+    def append(self, other):
+        """
+        Combine with newer bars into new compact bars sorted by time. Bars of other replace
+        bars at the same timestamp, so a bar that was still forming gets updated.
+        """
+        if len(self) == 0:
+            return other
+        if len(other) == 0:
+            return self
+        timestamps = np.concatenate([self.timestamps, other.timestamps])
+        order = np.argsort(timestamps, kind='stable')
+        # After a stable sort the bar from other is the last of equal timestamps
+        keep = order[np.append(timestamps[order][1:] != timestamps[order][:-1], True)]
+        columns = {column: np.concatenate([values, other[column]])[keep] for column, values in self.columns.items()}
+        return CompactBars(timestamps[keep], columns, other.tz or self.tz)
+
+    def to_frame(self):
+        """
+        Convert to a float64 DataFrame with a DatetimeIndex.
+        """
+        return pd.DataFrame({column: values.astype('float64') for column, values in self.columns.items()}, index=self.index())
+
+
+class TradeLog:
+    """
+    Array-backed trade log. Trades go into a preallocated structured array that doubles in
+    size when full, instead of one dict per trade.
+    """
+
+    __slots__ = ('trades', 'size', 'tz')
+
+    def __init__(self, capacity=64, tz=None):
+        self.trades = np.empty(capacity, dtype=TRADE_DTYPE)
+        self.size = 0
+        self.tz = tz
+
+    def __len__(self):
+        return self.size
+
+    def append(self, action, shares, price, time, reason):
+        """
+        Record a trade.
+
+        Parameters:
+        - action (str): 'buy' or 'sell'.
+        - shares (float): Number of shares.
+        - price (float): Fill price.
+        - time (int): Bar time in UTC nanoseconds.
+        - reason (str): One of TRADE_REASONS.
+        """
+        if self.size == len(self.trades):
+            grown = np.empty(max(1, 2 * len(self.trades)), dtype=TRADE_DTYPE)
+            grown[:self.size] = self.trades
+            self.trades = grown
+        self.trades[self.size] = (time, TRADE_ACTIONS.index(action), TRADE_REASONS.index(reason), shares, price)
+        self.size += 1
+
+    def view(self):
+        """
+        Structured array of the recorded trades.
+        """
+        return self.trades[:self.size]
+
+    def signals(self, action):
+        """
+        (time, price) pairs of the trades with one action, for plotting.
+        """
+        trades = self.view()
+        trades = trades[trades['action'] == TRADE_ACTIONS.index(action)]
+        return list(zip(self._times(trades['time']), trades['price'].tolist()))
+
+    def records(self):
+        """
+        Trades as dicts with 'action', 'shares', 'price', 'time' and 'reason' keys.
+        """
+        trades = self.view()
+        return [
+            {
+                'action': TRADE_ACTIONS[trade['action']],
+                'shares': float(trade['shares']),
+                'price': float(trade['price']),
+                'time': time,
+                'reason': TRADE_REASONS[trade['reason']],
+            }
+            for trade, time in zip(trades, self._times(trades['time']))
+        ]
+
+    def to_frame(self):
+        """
+        Trades as a DataFrame, one row per trade.
+        """
+        return pd.DataFrame(self.records(), columns=['action', 'shares', 'price', 'time', 'reason'])
+
+    def _times(self, timestamps):
+        times = pd.DatetimeIndex(timestamps.view('datetime64[ns]'))
+        return list(times if self.tz is None else times.tz_localize('UTC').tz_convert(self.tz))
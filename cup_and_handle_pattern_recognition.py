@@ -6,13 +6,10 @@ import matplotlib.pyplot as plt
 import yfinance as yf
 import tensorflow as tf
 from tensorflow.keras import layers, models
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report, confusion_matrix
-import sys
-import io
 import mplfinance as mpf
 from datetime import datetime, timedelta
 import os
+from collections import namedtuple
 
 
 # Suppress warnings (optional)
@@ -56,43 +53,60 @@ def create_windows(data, window_size):
 
 # Step 2: Data Labeling
 
-def label_windows(windows):
+# Thresholds for the heuristic cup and handle detector
+CupAndHandleParams = namedtuple(
+    'CupAndHandleParams',
+    [
+        'min_cup_length',
+        'max_cup_length',
+        'min_handle_length',
+        'max_handle_length',
+        'min_depth',           # Minimum depth of the cup (fraction of the peak average)
+        'max_depth',           # Maximum depth of the cup
+        'handle_max_retrace',  # Handle retracement should not exceed this fraction of cup depth
+    ],
+    defaults=[10, 60, 5, 20, 0.1, 0.5, 0.5],
+)
+DEFAULT_CUP_AND_HANDLE_PARAMS = CupAndHandleParams()
+
+def label_windows(windows, params=DEFAULT_CUP_AND_HANDLE_PARAMS):
     """
     Label windows as containing a cup and handle pattern or not.
 
     Parameters:
     - windows (ndarray): Array of windows.
+    - params (CupAndHandleParams): Detector thresholds.
 
     Returns:
     - labels (ndarray): Array of labels (1 for pattern, 0 for no pattern).
     """
     labels = []
     for window in windows:
-        label = detect_cup_and_handle_in_window(window)
+        label = detect_cup_and_handle_in_window(window, params)
         labels.append(label)
     return np.array(labels)
 
-def detect_cup_and_handle_in_window(window):
+def detect_cup_and_handle_in_window(window, params=DEFAULT_CUP_AND_HANDLE_PARAMS):
     """
     Detects a cup and handle pattern in a window using heuristic rules.
 
     Parameters:
     - window (DataFrame): Window of stock data.
+    - params (CupAndHandleParams): Detector thresholds.
 
     Returns:
     - label (int): 1 if pattern is detected, 0 otherwise.
     """
     close_prices = window['Close'].values
-    volume = window['Volume'].values
 
     # Parameters for cup and handle detection
-    min_cup_length = 10
-    max_cup_length = 60
-    min_handle_length = 5
-    max_handle_length = 20
-    min_depth = 0.1  # Minimum depth of the cup (10%)
-    max_depth = 0.5  # Maximum depth of the cup (50%)
-    handle_max_retrace = 0.5  # Handle retracement should not exceed 50% of cup depth
+    min_cup_length = params.min_cup_length
+    max_cup_length = params.max_cup_length
+    min_handle_length = params.min_handle_length
+    max_handle_length = params.max_handle_length
+    min_depth = params.min_depth
+    max_depth = params.max_depth
+    handle_max_retrace = params.handle_max_retrace
 
     # Step 1: Identify the cup
     cup_found = False
@@ -123,7 +137,7 @@ def detect_cup_and_handle_in_window(window):
             if handle_max > peak_average:
                 continue
 
-            # Handle retracement should not exceed 50% of cup depth
+            # Handle retracement should not exceed handle_max_retrace of cup depth
             handle_retrace = (handle_max - handle_min) / (peak_average - cup_bottom)
             if handle_retrace > handle_max_retrace:
                 continue
@@ -138,6 +152,90 @@ def detect_cup_and_handle_in_window(window):
     label = 1 if cup_found else 0
     return label
 
+def precompute_window_structures(close_windows, max_handle_length):
+    """
+    Precompute the per-window range structures the detector needs, so many parameter sets
+    can be evaluated without rescanning the prices.
+
+    Parameters:
+    - close_windows (ndarray): Close prices, one row per window (num_windows, window_size).
+    - max_handle_length (int): Largest max_handle_length that will be evaluated.
+
+    Returns:
+    - structures (dict): Close prices, prefix minima and their first positions, and the
+      running maximum/minimum of every handle (row, cup end, handle length - 1).
+    """
+    close = np.asarray(close_windows, dtype='float64')
+    num_windows, window_size = close.shape
+    positions = np.arange(window_size)
+
+    prefix_min = np.minimum.accumulate(close, axis=1)
+    # np.argmin returns the first occurrence, so a new minimum only counts when strictly lower
+    new_min = np.ones_like(close, dtype=bool)
+    new_min[:, 1:] = close[:, 1:] < prefix_min[:, :-1]
+    prefix_argmin = np.maximum.accumulate(np.where(new_min, positions, 0), axis=1)
+
+    # handle_max[:, i, k - 1] = max(close[:, i+1:i+1+k]); NaN where the handle runs past the window
+    longest_handle = max(1, min(max_handle_length - 1, window_size - 1))
+    handle_max = np.full((num_windows, window_size, longest_handle), np.nan)
+    handle_min = np.full((num_windows, window_size, longest_handle), np.nan)
+    handle_max[:, :-1, 0] = close[:, 1:]
+    handle_min[:, :-1, 0] = close[:, 1:]
+    for k in range(1, longest_handle):
+        handle_max[:, :-(k + 1), k] = np.maximum(handle_max[:, :-(k + 1), k - 1], close[:, k + 1:])
+        handle_min[:, :-(k + 1), k] = np.minimum(handle_min[:, :-(k + 1), k - 1], close[:, k + 1:])
+
+    return {
+        'close': close,
+        'prefix_min': prefix_min,
+        'prefix_argmin': prefix_argmin,
+        'handle_max': handle_max,
+        'handle_min': handle_min,
+    }
+
+def label_with_structures(structures, params=DEFAULT_CUP_AND_HANDLE_PARAMS):
+    """
+    Vectorised equivalent of label_windows over precomputed window structures. Gives the
+    same labels as detect_cup_and_handle_in_window on every window.
+
+    Parameters:
+    - structures (dict): Output of precompute_window_structures.
+    - params (CupAndHandleParams): Detector thresholds.
+
+    Returns:
+    - labels (ndarray): Array of labels (1 for pattern, 0 for no pattern).
+    """
+    close = structures['close']
+    num_windows, window_size = close.shape
+    longest_handle = structures['handle_max'].shape[2]
+    if min(params.max_handle_length, window_size) - 1 > longest_handle:
+        raise ValueError("Window structures were precomputed for shorter handles than params.max_handle_length.")
+
+    found = np.zeros(num_windows, dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(params.min_cup_length, min(params.max_cup_length, window_size - params.min_handle_length)):
+            bottom_index = structures['prefix_argmin'][:, i]
+            cup_bottom = structures['prefix_min'][:, i]
+            peak_average = (close[:, 0] + close[:, i]) / 2
+            depth = (peak_average - cup_bottom) / peak_average
+
+            # Written as negated rejections so NaNs behave as in the loop version
+            cup = (bottom_index != 0) & (bottom_index != i) & ~(depth < params.min_depth) & ~(depth > params.max_depth)
+            cup &= ~found
+            if not cup.any():
+                continue
+
+            # Handle lengths k = j - i for j in range(i + min_handle_length, min(i + max_handle_length, window_size))
+            lengths = slice(params.min_handle_length - 1, min(params.max_handle_length, window_size - i) - 1)
+            handle_max = structures['handle_max'][cup, i, lengths]
+            handle_min = structures['handle_min'][cup, i, lengths]
+            peak = peak_average[cup, None]
+            handle_retrace = (handle_max - handle_min) / (peak - cup_bottom[cup, None])
+            handle = ~(handle_max > peak) & ~(handle_retrace > params.handle_max_retrace)
+            found[np.flatnonzero(cup)[handle.any(axis=1)]] = True
+
+    return found.astype(int)
+
 # Step 3: Feature Engineering
 
 def preprocess_windows(windows):
@@ -185,73 +283,18 @@ def build_cnn_model(input_shape):
     model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
     return model
 
-# Step 5: Model Training
-
-def train_model(model, X_train, y_train, X_val, y_val):
-    """
-    Train the CNN model.
-
-    Parameters:
-    - model (Model): Compiled Keras model.
-    - X_train (ndarray): Training features.
-    - y_train (ndarray): Training labels.
-    - X_val (ndarray): Validation features.
-    - y_val (ndarray): Validation labels.
-
-    Returns:
-    - history (History): Training history.
-    """
-    history = model.fit(
-        X_train, y_train,
-        epochs=20,
-        batch_size=32,
-        validation_data=(X_val, y_val),
-        verbose=0
-    )
-    return history
-
-# Step 6: Model Evaluation
-
-def evaluate_model(model, X_test, y_test):
-    """
-    Evaluate the model on the test set.
-
-    Parameters:
-    - model (Model): Trained Keras model.
-    - X_test (ndarray): Test features.
-    - y_test (ndarray): Test labels.
-
-    Returns:
-    - None
-    """
-
-    # Suppress stdout temporarily
-    original_stdout = sys.stdout
-    sys.stdout = io.StringIO()
-
-    # Perform prediction
-    y_pred_prob = model.predict(X_test)
-
-    # Restore stdout
-    sys.stdout = original_stdout
-    
-    y_pred_prob = model.predict(X_test, verbose=0)
-    y_pred = (y_pred_prob > 0.5).astype("int32")
-    print("\nClassification Report:")
-    print(classification_report(y_test, y_pred, zero_division=0))
-    print("\nConfusion Matrix:")
-    print(confusion_matrix(y_test, y_pred))
-
 # Step 7: Prediction on New Data
 
-def predict_on_new_data(model, data, window_size):
+def predict_on_new_data(model, data, window_size, threshold=0.5):
     """
     Use the trained model to predict patterns on new data.
 
     Parameters:
-    - model (Model): Trained Keras model.
+    - model (Model): Trained Keras model, or a TFLitePatternClassifier for the TFLite runtime.
     - data (DataFrame): New stock data.
     - window_size (int): Size of the window.
+    - threshold (float): Probability above which a window is a pattern; use
+      walk_forward_training.decision_threshold for the saved model.
 
     Returns:
     - predictions (ndarray): Array of predictions.
@@ -259,16 +302,8 @@ def predict_on_new_data(model, data, window_size):
     windows = create_windows(data, window_size)
     X_new = preprocess_windows(windows)
 
-    # Suppress stdout temporarily
-    original_stdout = sys.stdout
-    sys.stdout = io.StringIO()
-    
     predictions_prob = model.predict(X_new, verbose=0)
-
-        # Restore stdout
-    sys.stdout = original_stdout
-    
-    predictions = (predictions_prob > 0.5).astype("int32")
+    predictions = (predictions_prob > threshold).astype("int32")
     return predictions, windows
 
 # Step 8: Main Execution
@@ -294,50 +329,42 @@ if __name__ == '__main__':
     negative_samples = len(labels) - positive_samples
     print(f"Labeled windows. Positive samples: {positive_samples}, Negative samples: {negative_samples}")
 
-    # Handle class imbalance if necessary
-    # For example, you can undersample the majority class or use class weights
-    # For simplicity, we'll proceed without addressing imbalance in this example
-
     # Preprocess windows
     X = preprocess_windows(windows)
     y = labels
 
-    # Split data into training, validation, and test sets
-    X_temp, X_test, y_temp, y_test = train_test_split(X, y, test_size=0.15, random_state=42, stratify=y)
-    X_train, X_val, y_train, y_val = train_test_split(X_temp, y_temp, test_size=0.15 / 0.85, random_state=42, stratify=y_temp)
-
-    print(f"Training samples: {len(y_train)}, Validation samples: {len(y_val)}, Test samples: {len(y_test)}")
-
-    # Build model
-    input_shape = (X_train.shape[1], X_train.shape[2])
-    model = build_cnn_model(input_shape)
-
-    # Train model
-    history = train_model(model, X_train, y_train, X_val, y_val)
-
-    # Evaluate model
-    evaluate_model(model, X_test, y_test)
-
-    # Plot training history
-    plt.figure(figsize=(12, 4))
+    # Train walk-forward: warm-start from the saved model and fine-tune on the windows added
+    # since it was last trained, evaluating each step on the next out-of-sample slice with
+    # the streaming harness (evaluation_harness.py)
+    from walk_forward_training import decision_threshold, walk_forward_train
+    target_precision = 0.9
+    model, training_log = walk_forward_train(data, X, y, window_size, ticker=ticker, target_precision=target_precision)
+    if len(training_log) == 0:
+        print("Model is already up to date with this data.")
+    else:
+        print(f"Walk-forward training took {training_log['train_seconds'].sum():.1f}s over {len(training_log)} steps.")
+        calibrated = training_log.dropna(subset=['calibrated_threshold'])
+        if len(calibrated) > 0:
+            print(f"Out-of-sample threshold for precision {target_precision}: {calibrated['calibrated_threshold'].iloc[-1]:.3f}")
+    print("Model saved as 'cup_and_handle_cnn_model.keras'.")
 
-    plt.subplot(1, 2, 1)
-    plt.plot(history.history['accuracy'], label='Train Acc')
-    plt.plot(history.history['val_accuracy'], label='Val Acc')
-    plt.title('Accuracy')
-    plt.legend()
+    # Plot out-of-sample metrics per walk-forward step
+    tested = training_log.dropna(subset=['test_accuracy']) if len(training_log) > 0 else training_log
+    if len(tested) > 0:
+        plt.figure(figsize=(12, 4))
 
-    plt.subplot(1, 2, 2)
-    plt.plot(history.history['loss'], label='Train Loss')
-    plt.plot(history.history['val_loss'], label='Val Loss')
-    plt.title('Loss')
-    plt.legend()
+        plt.subplot(1, 2, 1)
+        plt.plot(tested['cutoff'], tested['test_accuracy'], label='Test Acc')
+        plt.plot(tested['cutoff'], tested['test_precision'], label='Test Precision')
+        plt.plot(tested['cutoff'], tested['test_recall'], label='Test Recall')
+        plt.title('Out-of-sample Metrics')
+        plt.legend()
 
-    plt.show()
+        plt.subplot(1, 2, 2)
+        plt.bar(range(len(training_log)), training_log['train_seconds'])
+        plt.title('Training Time per Step (s)')
 
-    # Save the model
-    model.save('cup_and_handle_cnn_model.keras')
-    print("Model saved as 'cup_and_handle_cnn_model.keras'.")
+        plt.show()
 
     # Predict on new data
     # For demonstration, we'll use recent data from the last year
@@ -351,7 +378,7 @@ if __name__ == '__main__':
     new_start_date = one_year_ago.strftime('%Y-%m-%d')
     new_end_date = today.strftime('%Y-%m-%d')
     new_data = fetch_stock_data(ticker, new_start_date, new_end_date)
-    predictions, new_windows = predict_on_new_data(model, new_data, window_size)
+    predictions, new_windows = predict_on_new_data(model, new_data, window_size, decision_threshold('cup_and_handle_cnn_model.keras'))
 
     # Create a folder with the format 'TICKER_MM-DD-YYYY_ANALYSIS'
     folder_name = f"{ticker}_{today.strftime('%m-%d-%Y')}_ANALYSIS"
@@ -363,35 +390,35 @@ if __name__ == '__main__':
     print(f"Detected {len(pattern_indices)} potential cup and handle patterns in new data.")
 
     # Plot detected patterns
-for i, idx in enumerate(pattern_indices, start=1):
-    window = new_windows[idx]
-    dates = window.index
-    date_range = f"{dates[0].strftime('%Y-%m-%d')} to {dates[-1].strftime('%Y-%m-%d')}"
+    for i, idx in enumerate(pattern_indices, start=1):
+        window = new_windows[idx]
+        dates = window.index
+        date_range = f"{dates[0].strftime('%Y-%m-%d')} to {dates[-1].strftime('%Y-%m-%d')}"
     
-    # Calculate the price range
-    price_min = window['Low'].min()
-    price_max = window['High'].max()
-    price_range = f"Price range: {price_min:.2f} to {price_max:.2f}"
+        # Calculate the price range
+        price_min = window['Low'].min()
+        price_max = window['High'].max()
+        price_range = f"Price range: {price_min:.2f} to {price_max:.2f}"
     
-    # Prepare the data for candlestick chart
-    candlestick_data = window[['Open', 'High', 'Low', 'Close']].copy()
-    candlestick_data.index = dates
-
-    # Define the filename for the last pattern's plot
-    if i == len(pattern_indices):
-        plot_filename = os.path.join(folder_name, 'latest_cup_handle_pattern.png')
-    else:
-        plot_filename = os.path.join(folder_name, f'cup_handle_pattern_{i}.png')  # e.g., pattern_1.png, pattern_2.png, etc.
+        # Prepare the data for candlestick chart
+        candlestick_data = window[['Open', 'High', 'Low', 'Close']].copy()
+        candlestick_data.index = dates
+
+        # Define the filename for the last pattern's plot
+        if i == len(pattern_indices):
+            plot_filename = os.path.join(folder_name, 'latest_cup_handle_pattern.png')
+        else:
+            plot_filename = os.path.join(folder_name, f'cup_handle_pattern_{i}.png')  # e.g., pattern_1.png, pattern_2.png, etc.
     
-    # Plot the candlestick chart
-    mpf.plot(
-        candlestick_data, 
-        type='candle', 
-        title=f"Cup and Handle Pattern {i}/{len(pattern_indices)}\n{date_range}\n{price_range}", 
-        style='yahoo',
-        savefig=plot_filename  # Saves the plot as 'pattern_i.png'
-    )
-
-# After the plotting loop
-print("\nAll detected cup and handle patterns have been saved.")
-input("Press Enter to exit the program.")
+        # Plot the candlestick chart
+        mpf.plot(
+            candlestick_data, 
+            type='candle', 
+            title=f"Cup and Handle Pattern {i}/{len(pattern_indices)}\n{date_range}\n{price_range}", 
+            style='yahoo',
+            savefig=plot_filename  # Saves the plot as 'pattern_i.png'
+        )
+
+    # After the plotting loop
+    print("\nAll detected cup and handle patterns have been saved.")
+    input("Press Enter to exit the program.")
@@ -3,11 +3,14 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import yfinance as yf
 import tensorflow as tf
-from tensorflow.keras import layers, models
-from sklearn.model_selection import train_test_split
 import mplfinance as mpf
 from datetime import datetime, timedelta
+import os
 import streamlit as st
+from cup_and_handle_pattern_recognition import DEFAULT_CUP_AND_HANDLE_PARAMS
+from walk_forward_training import decision_threshold, walk_forward_train
+from pattern_similarity_index import PatternSimilarityIndex
+from result_cache import default_cache, memoize
 
 # Suppress warnings (optional)
 import warnings
@@ -35,30 +38,30 @@ def create_windows(data, window_size):
 
 # Step 2: Data Labeling
 
-def label_windows(windows):
+@memoize
+def label_windows(windows, params=DEFAULT_CUP_AND_HANDLE_PARAMS):
     """
     Label windows as containing a cup and handle pattern or not.
     """
     labels = []
     for window in windows:
-        label = detect_cup_and_handle_in_window(window)
+        label = detect_cup_and_handle_in_window(window, params)
         labels.append(label)
     return np.array(labels)
 
-def detect_cup_and_handle_in_window(window):
+def detect_cup_and_handle_in_window(window, params=DEFAULT_CUP_AND_HANDLE_PARAMS):
     """
     Detects a cup and handle pattern in a window using heuristic rules.
     """
     close_prices = window['Close'].values
-    volume = window['Volume'].values
 
-    min_cup_length = 10
-    max_cup_length = 60
-    min_handle_length = 5
-    max_handle_length = 20
-    min_depth = 0.1
-    max_depth = 0.5
-    handle_max_retrace = 0.5
+    min_cup_length = params.min_cup_length
+    max_cup_length = params.max_cup_length
+    min_handle_length = params.min_handle_length
+    max_handle_length = params.max_handle_length
+    min_depth = params.min_depth
+    max_depth = params.max_depth
+    handle_max_retrace = params.handle_max_retrace
 
     cup_found = False
     for i in range(min_cup_length, min(max_cup_length, len(close_prices) - min_handle_length)):
@@ -111,36 +114,38 @@ def preprocess_windows(windows):
     X = X.reshape((X.shape[0], X.shape[1], 1))
     return X
 
-# Step 4: Model Building
-
-def build_cnn_model(input_shape):
-    """
-    Build a CNN model for time series classification.
-    """
-    model = models.Sequential()
-    model.add(layers.Conv1D(32, kernel_size=3, activation='relu', input_shape=input_shape))
-    model.add(layers.MaxPooling1D(pool_size=2))
-    model.add(layers.Conv1D(64, kernel_size=3, activation='relu'))
-    model.add(layers.MaxPooling1D(pool_size=2))
-    model.add(layers.Flatten())
-    model.add(layers.Dense(50, activation='relu'))
-    model.add(layers.Dense(1, activation='sigmoid'))
-    model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
-    return model
-
 # Step 7: Prediction on New Data
 
-def predict_on_new_data(model, data, window_size):
+def predict_on_new_data(model, data, window_size, threshold=0.5):
     """
-    Use the trained model to predict patterns on new data.
+    Use the trained model to predict patterns on new data, counting windows whose
+    probability is above threshold as patterns.
     """
     windows = create_windows(data, window_size)
     X_new = preprocess_windows(windows)
 
-    predictions_prob = model.predict(X_new, verbose=0)
-    predictions = (predictions_prob > 0.5).astype("int32")
+    predictions_prob = predict_probabilities(model, X_new)
+    predictions = (predictions_prob > threshold).astype("int32")
     return predictions, windows
 
+@memoize
+def predict_probabilities(model, X):
+    """
+    Pattern probabilities for preprocessed windows, cached by model weights and input.
+    """
+    return model.predict(X, verbose=0)
+
+# Step 8: Similar Historical Formations
+
+SIMILARITY_INDEX_PATH = 'pattern_similarity_index'
+
+@st.cache_resource
+def load_similarity_index(path):
+    """
+    Load the historical pattern similarity index built by pattern_similarity_index.py.
+    """
+    return PatternSimilarityIndex.load(path)
+
 # Step 5: Streamlit App Code
 
 st.title("Cup and Handle Pattern Detection")
@@ -172,15 +177,12 @@ st.write(f"💡 Pattern detection at work... We've uncovered {positive_samples}
 X = preprocess_windows(windows)
 y = labels
 
-# Split data into training, validation, and test sets
-X_temp, X_test, y_temp, y_test = train_test_split(X, y, test_size=0.15, random_state=42, stratify=y)
-X_train, X_val, y_train, y_val = train_test_split(X_temp, y_temp, test_size=0.15 / 0.85, random_state=42, stratify=y_temp)
-
-input_shape = (X_train.shape[1], X_train.shape[2])
-model = build_cnn_model(input_shape)
-
-# Train model
-history = model.fit(X_train, y_train, epochs=20, batch_size=32, validation_data=(X_val, y_val), verbose=0)
+# Train walk-forward, warm-starting from the saved model so reruns only fine-tune on new windows
+model, training_log = walk_forward_train(data, X, y, window_size, ticker=ticker, verbose=False)
+if len(training_log) > 0:
+    st.write(f"🧠 Training the model... {len(training_log)} walk-forward steps on {training_log['sampled_windows'].sum()} of {training_log['train_windows'].sum()} windows done in {training_log['train_seconds'].sum():.1f}s.")
+    with st.expander("Walk-forward training log"):
+        st.dataframe(training_log)
 
 # Predict on new data (last year's data)
 today = datetime.today()
@@ -189,7 +191,7 @@ new_start_date = one_year_ago.strftime('%Y-%m-%d')
 new_end_date = today.strftime('%Y-%m-%d')
 
 new_data = fetch_stock_data(ticker, new_start_date, new_end_date)
-predictions, new_windows = predict_on_new_data(model, new_data, window_size)
+predictions, new_windows = predict_on_new_data(model, new_data, window_size, decision_threshold('cup_and_handle_cnn_model.keras'))
 
 # Get indices where cup and handle patterns are detected
 pattern_indices = np.where(predictions == 1)[0]
@@ -228,5 +230,22 @@ if len(pattern_indices) > 0:
     # Display the plot using Streamlit's pyplot
     st.pyplot(fig)
 
+    # Show the most similar historical formations and what happened after them
+    if os.path.exists(SIMILARITY_INDEX_PATH):
+        similarity_index = load_similarity_index(SIMILARITY_INDEX_PATH)
+        try:
+            # Embed the query the same way the index was built (normalised prices or CNN embeddings)
+            query_vector = similarity_index.vectorize(preprocess_windows([window]), model)[0]
+        except ValueError as e:
+            # E.g. an embedding index built before the model was last retrained
+            st.warning(f"Similar formations are unavailable: {e} Run pattern_similarity_index.py to rebuild it.")
+        else:
+            neighbours = similarity_index.query(query_vector, k=10, exclude=(ticker, dates[-1]))
+            st.write("🔁 History rhymes... The closest formations on record and their returns 5, 20 and 60 days later:")
+            st.dataframe(neighbours)
+
 else:
     st.write("No cup and handle pattern detected in the new data.")
+
+with st.expander("Result cache"):
+    st.json(default_cache().stats())
@@ -0,0 +1,286 @@
+# evaluation_harness.py
+
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_BINS = 1000  # Threshold resolution of the streamed curves (0.001)
+
+
+class StreamingBinaryMetrics:
+    """
+    Confusion counts, PR and ROC curves accumulated batch by batch.
+
+    Probabilities are counted into a fixed histogram per class instead of being kept, so
+    memory does not grow with the test set. Counts are exact for every threshold on the
+    grid 0, 1/n_bins, ..., 1 (a window is predicted positive when its probability is above
+    the threshold, as in evaluate_model).
+    """
+
+    def __init__(self, n_bins=DEFAULT_BINS):
+        self.n_bins = n_bins
+        # Bin k holds probabilities in ((k - 1) / n_bins, k / n_bins]; bin 0 holds exactly 0
+        self.positive_counts = np.zeros(n_bins + 1, dtype='int64')
+        self.negative_counts = np.zeros(n_bins + 1, dtype='int64')
+
+    @property
+    def thresholds(self):
+        return np.arange(self.n_bins + 1) / self.n_bins
+
+    def update(self, y_true, probabilities):
+        """
+        Add one batch of labels and predicted probabilities.
+        """
+        y_true = np.asarray(y_true).ravel().astype(bool)
+        probabilities = np.clip(np.asarray(probabilities, dtype='float64').ravel(), 0.0, 1.0)
+        bins = np.ceil(probabilities * self.n_bins).astype('int64')
+        self.positive_counts += np.bincount(bins[y_true], minlength=self.n_bins + 1)
+        self.negative_counts += np.bincount(bins[~y_true], minlength=self.n_bins + 1)
+
+    def merge(self, other):
+        """
+        Add the counts of another accumulator with the same resolution, e.g. to pool the
+        out-of-sample slices of several walk-forward steps.
+        """
+        if other.n_bins != self.n_bins:
+            raise ValueError(f"Cannot merge metrics with {other.n_bins} bins into metrics with {self.n_bins} bins.")
+        self.positive_counts += other.positive_counts
+        self.negative_counts += other.negative_counts
+        return self
+
+    def _counts(self):
+        """
+        True/false positives at every grid threshold (probability > threshold).
+        """
+        # Suffix sums: windows in bins above k are the ones with probability > k / n_bins
+        tp = np.append(np.cumsum(self.positive_counts[::-1])[::-1][1:], 0)
+        fp = np.append(np.cumsum(self.negative_counts[::-1])[::-1][1:], 0)
+        return tp, fp
+
+    def curve(self):
+        """
+        Metrics at every grid threshold.
+
+        Returns:
+        - curve (DataFrame): threshold, tp, fp, fn, tn, precision, recall (true positive
+          rate) and fpr (false positive rate), lowest threshold first.
+        """
+        tp, fp = self._counts()
+        positives = self.positive_counts.sum()
+        negatives = self.negative_counts.sum()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.where(tp + fp > 0, tp / (tp + fp), 1.0)
+            recall = tp / positives if positives else np.zeros_like(tp, dtype='float64')
+            fpr = fp / negatives if negatives else np.zeros_like(fp, dtype='float64')
+        return pd.DataFrame({
+            'threshold': self.thresholds,
+            'tp': tp,
+            'fp': fp,
+            'fn': positives - tp,
+            'tn': negatives - fp,
+            'precision': precision,
+            'recall': recall,
+            'fpr': fpr,
+        })
+
+    def confusion(self, threshold=0.5):
+        """
+        Confusion counts at one threshold, snapped to the nearest grid point.
+
+        Returns:
+        - counts (dict): tp, fp, fn, tn.
+        """
+        row = self.curve().iloc[int(round(threshold * self.n_bins))]
+        return {name: int(row[name]) for name in ('tp', 'fp', 'fn', 'tn')}
+
+    def summary(self, threshold=0.5):
+        """
+        Precision, recall, F1 and accuracy at one threshold.
+        """
+        counts = self.confusion(threshold)
+        tp, fp, fn, tn = counts['tp'], counts['fp'], counts['fn'], counts['tn']
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        accuracy = (tp + tn) / (tp + fp + fn + tn) if tp + fp + fn + tn else 0.0
+        return dict(counts, threshold=threshold, precision=precision, recall=recall, f1=f1, accuracy=accuracy)
+
+    def roc_auc(self):
+        """
+        Area under the ROC curve (trapezoidal over the grid).
+        """
+        curve = self.curve()
+        # Add the all-positive operating point (threshold below 0) at (1, 1)
+        fpr = np.append(1.0, curve['fpr'].to_numpy())[::-1]
+        tpr = np.append(1.0, curve['recall'].to_numpy())[::-1]
+        return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+    def average_precision(self):
+        """
+        Average precision: precision weighted by the recall gained at each threshold.
+        """
+        positives = self.positive_counts.sum()
+        if positives == 0:
+            return 0.0
+        curve = self.curve()
+        recall = np.append(curve['recall'].to_numpy(), 0.0)
+        precision = curve['precision'].to_numpy()
+        # Positives scored exactly 0 are only recalled with every window predicted positive
+        base_rate = positives / (positives + self.negative_counts.sum())
+        return float(np.sum((recall[:-1] - recall[1:]) * precision) + (1.0 - recall[0]) * base_rate)
+
+    def threshold_for_precision(self, target_precision):
+        """
+        Operating threshold with the highest recall whose precision reaches the target.
+
+        Parameters:
+        - target_precision (float): Minimum precision, e.g. 0.9.
+
+        Returns:
+        - operating_point (dict): threshold, precision and recall, or None if no threshold
+          reaches the target.
+        """
+        curve = self.curve()
+        candidates = curve[(curve['precision'] >= target_precision) & (curve['tp'] > 0)]
+        if len(candidates) == 0:
+            return None
+        # Highest recall; among ties the lowest threshold
+        best = candidates.sort_values(['recall', 'threshold'], ascending=[False, True]).iloc[0]
+        return {'threshold': float(best['threshold']), 'precision': float(best['precision']), 'recall': float(best['recall'])}
+
+
+    def threshold_for_best_f1(self):
+        """
+        Operating threshold with the highest F1 score.
+
+        Returns:
+        - operating_point (dict): threshold, precision, recall and f1, or None if no
+          threshold predicts a true positive.
+        """
+        curve = self.curve()
+        curve = curve[curve['tp'] > 0]
+        if len(curve) == 0:
+            return None
+        f1 = 2 * curve['tp'] / (2 * curve['tp'] + curve['fp'] + curve['fn'])
+        # Highest F1; among ties the lowest threshold
+        best = curve.assign(f1=f1).sort_values(['f1', 'threshold'], ascending=[False, True]).iloc[0]
+        return {name: float(best[name]) for name in ('threshold', 'precision', 'recall', 'f1')}
+
+
+def iter_batches(X, y, batch_size):
+    """
+    Yield (X_batch, y_batch) slices; memory-mapped arrays are read one batch at a time.
+    """
+    for start in range(0, len(X), batch_size):
+        yield np.asarray(X[start:start + batch_size], dtype='float32'), np.asarray(y[start:start + batch_size])
+
+
+def _predict_batch(model, X_batch):
+    # predict_on_batch skips the per-call dataset setup of Keras predict; TFLite wrappers only have predict
+    if hasattr(model, 'predict_on_batch'):
+        return np.asarray(model.predict_on_batch(X_batch))
+    return model.predict(X_batch, verbose=0)
+
+
+def stream_evaluate(model, batches, metrics=None, n_bins=DEFAULT_BINS):
+    """
+    Run a model over a stream of batches, accumulating metrics and timing each batch.
+
+    Parameters:
+    - model (Model): Keras model, or a TFLitePatternClassifier.
+    - batches (iterable): (X_batch, y_batch) pairs, e.g. from iter_batches or built from
+      chunked_pipeline.iter_window_chunks.
+    - metrics (StreamingBinaryMetrics, optional): Accumulator to add to. Created if omitted.
+    - n_bins (int): Threshold resolution of a new accumulator.
+
+    Returns:
+    - metrics (StreamingBinaryMetrics): The accumulated metrics.
+    - timing (dict): windows, batches, seconds and per-batch latencies in seconds.
+    """
+    if metrics is None:
+        metrics = StreamingBinaryMetrics(n_bins)
+
+    latencies = []
+    windows = 0
+    for X_batch, y_batch in batches:
+        start = time.perf_counter()
+        probabilities = _predict_batch(model, X_batch)
+        latencies.append(time.perf_counter() - start)
+        metrics.update(y_batch, probabilities)
+        windows += len(X_batch)
+
+    timing = {'windows': windows, 'batches': len(latencies), 'seconds': float(np.sum(latencies)), 'latencies': np.array(latencies)}
+    return metrics, timing
+
+
+def evaluate_streaming(model, X, y, batch_sizes=(1024,), target_precision=None, n_bins=DEFAULT_BINS):
+    """
+    Evaluate a model in batches and record inference throughput per batch size.
+
+    Metrics are accumulated on the first batch size; further batch sizes are timed only, so
+    quality and speed of a model change can be judged together.
+
+    Parameters:
+    - model (Model): Keras model, or a TFLitePatternClassifier.
+    - X (ndarray): Preprocessed test windows; a memory-mapped .npy works as well.
+    - y (ndarray): Test labels.
+    - batch_sizes (tuple): Batch sizes to run.
+    - target_precision (float, optional): Precision the operating threshold is calibrated for.
+    - n_bins (int): Threshold resolution of the curves.
+
+    Returns:
+    - metrics (StreamingBinaryMetrics): Confusion counts and curves.
+    - report (dict): Summary at 0.5 and, with a target precision, at the calibrated
+      threshold; ROC AUC and average precision.
+    - throughput (DataFrame): One row per batch size with windows per second and mean and
+      95th percentile batch latency in milliseconds.
+    """
+    metrics = None
+    rows = []
+    for batch_size in batch_sizes:
+        # Warm up both batch shapes (full and the final partial batch) so graph tracing is not timed
+        _predict_batch(model, np.asarray(X[:batch_size], dtype='float32'))
+        if len(X) > batch_size and len(X) % batch_size:
+            _predict_batch(model, np.asarray(X[-(len(X) % batch_size):], dtype='float32'))
+        if metrics is None:
+            metrics, timing = stream_evaluate(model, iter_batches(X, y, batch_size), n_bins=n_bins)
+        else:
+            _, timing = stream_evaluate(model, iter_batches(X, y, batch_size), n_bins=n_bins)
+        rows.append({
+            'batch_size': batch_size,
+            'windows_per_second': timing['windows'] / timing['seconds'] if timing['seconds'] else np.nan,
+            'latency_ms': float(np.mean(timing['latencies'])) * 1000 if timing['batches'] else np.nan,
+            'p95_latency_ms': float(np.percentile(timing['latencies'], 95)) * 1000 if timing['batches'] else np.nan,
+        })
+
+    report = {
+        'default': metrics.summary(0.5),
+        'roc_auc': metrics.roc_auc(),
+        'average_precision': metrics.average_precision(),
+    }
+    if target_precision is not None:
+        operating_point = metrics.threshold_for_precision(target_precision)
+        report['calibrated'] = metrics.summary(operating_point['threshold']) if operating_point is not None else None
+
+    return metrics, report, pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    from tensorflow.keras import models
+    from cup_and_handle_pattern_recognition import create_windows, fetch_stock_data, label_windows, preprocess_windows
+
+    model = models.load_model('cup_and_handle_cnn_model.keras')
+    ticker = input("Enter the stock ticker symbol to evaluate on (e.g., AAPL, NVDA): ")
+    target_precision = float(input("Enter the target precision (e.g., 0.9): "))
+
+    data = fetch_stock_data(ticker, '2010-01-01', pd.Timestamp.today().strftime('%Y-%m-%d'))
+    windows = create_windows(data, 60)
+    metrics, report, throughput = evaluate_streaming(
+        model, preprocess_windows(windows), label_windows(windows),
+        batch_sizes=(64, 256, 1024, 4096), target_precision=target_precision,
+    )
+    print(f"ROC AUC {report['roc_auc']:.3f}, average precision {report['average_precision']:.3f}")
+    print(f"At 0.5: {report['default']}")
+    print(f"Calibrated for precision {target_precision}: {report['calibrated']}")
+    print(throughput.to_string(index=False))
@@ -0,0 +1,287 @@
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import ta
+
+from compact_bars import CompactBars
+from intraday_archive import BAR_DTYPE, bars_to_array, merge_bars, to_utc_nanoseconds
+
+# Indicator specs as (name, parameters); these reproduce the columns the app has always used
+DEFAULT_INDICATORS = (
+    ('RSI', {'window': 14}),
+    ('MACD', {'window_slow': 26, 'window_fast': 12, 'window_sign': 9}),
+    ('BB', {'window': 20, 'window_dev': 2}),
+    ('SMA', {'window': 50}),
+    ('SMA', {'window': 200}),
+)
+
+# One lock per feature file, so threads (screener workers, concurrent Streamlit sessions)
+# never update the same ticker and interval at once
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+
+# EWM-based indicators never fully forget old bars; the warm-up is the number of bars after
+# which restarting the recursion changes the result by less than this fraction
+EWM_TOLERANCE = 1e-12
+
+
+def _ewm_warmup(alpha):
+    return int(np.ceil(np.log(EWM_TOLERANCE) / np.log(1 - alpha)))
+
+
+def _rsi_columns(close, window):
+    rsi = ta.momentum.RSIIndicator(close=close, window=window)
+    return {'RSI': rsi.rsi()}
+
+
+def _rsi_warmup(window):
+    return max(window + 1, _ewm_warmup(1 / window))
+
+
+def _macd_columns(close, window_slow, window_fast, window_sign):
+    macd = ta.trend.MACD(close=close, window_slow=window_slow, window_fast=window_fast, window_sign=window_sign)
+    return {'MACD': macd.macd(), 'MACD_Signal': macd.macd_signal()}
+
+
+def _macd_warmup(window_slow, window_fast, window_sign):
+    slow = max(window_slow, _ewm_warmup(2 / (window_slow + 1)))
+    fast = max(window_fast, _ewm_warmup(2 / (window_fast + 1)))
+    return max(slow, fast) + max(window_sign, _ewm_warmup(2 / (window_sign + 1)))
+
+
+def _bollinger_columns(close, window, window_dev):
+    bollinger = ta.volatility.BollingerBands(close=close, window=window, window_dev=window_dev)
+    return {
+        'Upper_Band': bollinger.bollinger_hband(),
+        'Middle_Band': bollinger.bollinger_mavg(),
+        'Lower_Band': bollinger.bollinger_lband(),
+    }
+
+
+def _bollinger_warmup(window, window_dev):
+    return window - 1
+
+
+def _sma_columns(close, window):
+    sma = ta.trend.SMAIndicator(close=close, window=window)
+    return {f'SMA{window}': sma.sma_indicator()}
+
+
+def _sma_warmup(window):
+    return window - 1
+
+
+# name -> (function computing the indicator columns from a close series, warm-up span in bars)
+INDICATORS = {
+    'RSI': (_rsi_columns, _rsi_warmup),
+    'MACD': (_macd_columns, _macd_warmup),
+    'BB': (_bollinger_columns, _bollinger_warmup),
+    'SMA': (_sma_columns, _sma_warmup),
+}
+
+
+def add_indicators(data, indicators=DEFAULT_INDICATORS):
+    """
+    Compute indicator columns over all the bars and add them in place. Indicators are
+    computed in float64 whatever the column dtype.
+
+    Parameters:
+    - data (DataFrame or CompactBars): Price data with a 'Close' column.
+    - indicators (tuple): Indicator specs as (name, parameters) pairs.
+
+    Returns:
+    - data (DataFrame or CompactBars): The same bars with the indicator columns added.
+    """
+    close = pd.Series(np.asarray(data['Close'], dtype='float64'))
+    for name, params in indicators:
+        compute, _ = INDICATORS[name]
+        for column, values in compute(close, **params).items():
+            data[column] = values.to_numpy()
+    return data
+
+
+def _file_lock(path):
+    with _file_locks_guard:
+        return _file_locks.setdefault(os.path.abspath(path), threading.RLock())
+
+
+def indicator_key(indicators=DEFAULT_INDICATORS):
+    """
+    Build a file-name friendly key from indicator specs, e.g. 'RSI-14_MACD-26-12-9_BB-20-2_SMA-50_SMA-200'.
+    """
+    return '_'.join(
+        '-'.join([name] + [str(value) for value in params.values()])
+        for name, params in indicators
+    )
+
+
+class FeatureStore:
+    """
+    Columnar store of price bars plus their indicator columns, keyed by ticker, interval
+    and indicator specs.
+
+    Each feature set is one raw file of fixed-width rows (prices first, then one float64
+    column per indicator output) with a JSON manifest holding the dtype and row count,
+    stored next to the intraday archive's partitions:
+    - TICKER/INTERVAL/features/KEY.bin
+    - TICKER/INTERVAL/features/KEY.json
+
+    When new bars arrive only the rows from the first new or revised bar onwards are
+    recomputed, each indicator reading back just its own warm-up span of older bars.
+    Loading is a single memory-mapped read into CompactBars.
+
+    Updates of one feature file are serialised by a lock and written to a temporary file
+    that replaces the old one, so a reader's memory map never sees a truncated file.
+    """
+
+    def __init__(self, root='intraday_archive', indicators=DEFAULT_INDICATORS):
+        self.root = root
+        self.indicators = tuple(indicators)
+        self.key = indicator_key(self.indicators)
+
+    def _paths(self, ticker, interval):
+        directory = os.path.join(self.root, ticker.upper(), interval, 'features')
+        return os.path.join(directory, f"{self.key}.bin"), os.path.join(directory, f"{self.key}.json")
+
+    def _read_manifest(self, ticker, interval):
+        data_path, manifest_path = self._paths(ticker, interval)
+        if not os.path.exists(manifest_path) or not os.path.exists(data_path):
+            return None
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        manifest['dtype'] = np.dtype([tuple(field) for field in manifest['dtype']])
+        # A data file shorter than the manifest claims means an interrupted write
+        if os.path.getsize(data_path) < manifest['rows'] * manifest['dtype'].itemsize:
+            return None
+        return manifest
+
+    def load(self, ticker, interval, start=None, end=None, as_bars=True):
+        """
+        Read the stored bars and indicator columns through a memory map.
+
+        Parameters:
+        - ticker (str): Stock ticker symbol.
+        - interval (str): Bar interval, e.g. '5m'.
+        - start (str or datetime, optional): First timestamp to include.
+        - end (str or datetime, optional): Timestamps before this are included.
+        - as_bars (bool): Return float32 CompactBars; otherwise the memory-mapped structured array.
+
+        Returns:
+        - features (CompactBars or ndarray): Bars with indicator columns, or None if nothing is stored.
+        """
+        data_path, _ = self._paths(ticker, interval)
+        # The lock keeps an update from replacing the file between reading the manifest and
+        # mapping the file; once mapped, the file stays readable even if it is replaced
+        with _file_lock(data_path):
+            manifest = self._read_manifest(ticker, interval)
+            if manifest is None or manifest['rows'] == 0:
+                return None
+            features = np.memmap(data_path, dtype=manifest['dtype'], mode='r', shape=(manifest['rows'],))
+        timestamps = features['timestamp']
+        lo, hi = 0, len(features)
+        if start is not None:
+            lo = np.searchsorted(timestamps, to_utc_nanoseconds(start, manifest['tz']), side='left')
+        if end is not None:
+            hi = np.searchsorted(timestamps, to_utc_nanoseconds(end, manifest['tz']), side='left')
+        features = features[lo:hi]
+
+        if as_bars:
+            return CompactBars.from_array(features, tz=manifest['tz'])
+        return features
+
+    def update(self, ticker, interval, data):
+        """
+        Merge new bars into the store and compute indicators for the changed tail only.
+
+        Bars already stored are kept as long as the new bars overlap them, so the store keeps
+        growing as the download window moves forward. Indicators at the start of a window
+        are therefore computed with the older bars as context: a long indicator such as
+        SMA200 has values on the first bars of a download that a fresh computation leaves
+        NaN, and results depend on what was stored before. If the new bars start after the
+        last stored bar, bars are missing in between and the stored bars are dropped rather
+        than computing indicators across the gap. Bars at existing timestamps replace the
+        stored ones.
+
+        Parameters:
+        - ticker (str): Stock ticker symbol.
+        - interval (str): Bar interval, e.g. '5m'.
+        - data (CompactBars): Bars with Open/High/Low/Close/Volume columns.
+
+        Returns:
+        - features (CompactBars): The stored bars from the first bar in data onwards, with indicator columns.
+        """
+        data_path, _ = self._paths(ticker, interval)
+        with _file_lock(data_path):
+            return self._update(ticker, interval, data)
+
+    def _update(self, ticker, interval, data):
+        tz = data.tz or 'UTC'
+        start = data.time(0)
+        new_bars = merge_bars(np.empty(0, dtype=BAR_DTYPE), bars_to_array(data))
+
+        manifest = self._read_manifest(ticker, interval)
+        stored = self.load(ticker, interval, as_bars=False)
+        if stored is not None and stored['timestamp'][-1] < new_bars['timestamp'][0]:
+            # No overlap with the stored bars: start over instead of bridging the gap
+            stored = None
+        if stored is None:
+            prices = new_bars
+            first_changed = 0
+        else:
+            stored_prices = np.empty(len(stored), dtype=BAR_DTYPE)
+            for field in BAR_DTYPE.names:
+                stored_prices[field] = stored[field]
+            prices = merge_bars(stored_prices, new_bars)
+            overlap = min(len(prices), len(stored_prices))
+            same = prices[:overlap] == stored_prices[:overlap]
+            first_changed = overlap if same.all() else int(np.argmin(same))
+            if first_changed == len(prices) == len(stored_prices):
+                return self.load(ticker, interval, start=start)
+
+        close = pd.Series(prices['Close'])
+        tail_columns = {}
+        for name, params in self.indicators:
+            compute, warmup = INDICATORS[name]
+            begin = max(0, first_changed - warmup(**params))
+            for column, values in compute(close.iloc[begin:], **params).items():
+                tail_columns[column] = values.to_numpy()[first_changed - begin:]
+
+        dtype = np.dtype(BAR_DTYPE.descr + [(column, '<f8') for column in tail_columns])
+        if manifest is not None and manifest['dtype'] != dtype:
+            return self._rewrite(ticker, interval, prices, tz, start)
+
+        tail = np.empty(len(prices) - first_changed, dtype=dtype)
+        for field in BAR_DTYPE.names:
+            tail[field] = prices[field][first_changed:]
+        for column, values in tail_columns.items():
+            tail[column] = values
+
+        data_path, manifest_path = self._paths(ticker, interval)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        # Unchanged rows are copied from the old file; the new file then replaces it whole
+        tmp_path = data_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            if first_changed > 0:
+                stored[:first_changed].tofile(f)
+            tail.tofile(f)
+        del stored
+        os.replace(tmp_path, data_path)
+
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'tz': tz, 'rows': len(prices), 'dtype': dtype.descr, 'indicators': self.key}, f, indent=2)
+        os.replace(tmp_path, manifest_path)
+        return self.load(ticker, interval, start=start)
+
+    def _rewrite(self, ticker, interval, prices, tz, start):
+        """
+        Drop the stored feature file and compute every indicator from scratch.
+        """
+        data_path, manifest_path = self._paths(ticker, interval)
+        os.remove(manifest_path)
+        self.update(ticker, interval, CompactBars.from_array(prices, tz=tz))
+        return self.load(ticker, interval, start=start)
+
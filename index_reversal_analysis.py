@@ -1,41 +1,44 @@
 import yfinance as yf
 import pandas as pd
-import ta
 import numpy as np
 import matplotlib.pyplot as plt
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+from intraday_archive import INTRADAY_LOOKBACK_DAYS, PRICE_COLUMNS, IntradayArchive
+from feature_store import FeatureStore, add_indicators
+from compact_bars import CompactBars, TradeLog
+from result_cache import default_cache, memoize
 
 # Step 1: Download Historical Data for both intraday and daily timeframes
 @st.cache_data
-def download_data(ticker, interval='5m'):
+def download_data(ticker, interval='5m', use_archive=False):
     """
     Download both intraday and daily historical market data for a given ticker.
     Handle the limitations of Yahoo Finance's API for different intraday intervals.
+    With use_archive, the newest intraday bars are appended to the local intraday archive
+    and the full archived history is returned instead of just Yahoo's lookback window.
+    Bars are returned as float32 CompactBars.
     """
     try:
         # Define the end date as today
         end_date = datetime.now()
         
         # Define the start date based on the interval
-        if interval == '1m':
-            # 1-minute interval allows only 7 days
-            start_date = end_date - timedelta(days=7)
-        elif interval in ['2m', '5m']:
-            # 2-minute and 5-minute intervals allow up to 60 days
-            start_date = end_date - timedelta(days=60)
-        elif interval in ['15m', '30m']:
-            # 15-minute and 30-minute intervals allow up to 60 days
-            start_date = end_date - timedelta(days=60)
-        elif interval in ['60m', '1h']:
-            # 60-minute and 1-hour intervals allow up to 730 days (2 years)
-            start_date = end_date - timedelta(days=730)
-        else:
+        if interval not in INTRADAY_LOOKBACK_DAYS:
             st.error(f"Interval '{interval}' is not supported. Please choose a valid interval.")
             return None, None
+        start_date = end_date - timedelta(days=INTRADAY_LOOKBACK_DAYS[interval])
 
         # Fetch intraday data using start and end dates
-        intraday_data = yf.Ticker(ticker).history(start=start_date, end=end_date, interval=interval)
+        if use_archive:
+            archive = IntradayArchive()
+            archive.update(ticker, interval)
+            intraday_data = archive.load(ticker, interval)
+            if intraday_data is None:
+                intraday_data = pd.DataFrame()
+        else:
+            intraday_data = yf.Ticker(ticker).history(start=start_date, end=end_date, interval=interval)
         
         # Fetch daily data (1 year)
         daily_start_date = end_date - timedelta(days=365)
@@ -50,7 +53,7 @@ def download_data(ticker, interval='5m'):
             st.error(f"No daily data found for {ticker}.")
             return None, None
 
-        return intraday_data, daily_data
+        return CompactBars.from_frame(intraday_data, PRICE_COLUMNS), CompactBars.from_frame(daily_data, PRICE_COLUMNS)
 
     except Exception as e:
         st.error(f"Error downloading data for {ticker}: {e}")
@@ -60,34 +63,15 @@ def download_data(ticker, interval='5m'):
 def calculate_indicators(data):
     """
     Calculate key technical indicators such as RSI, MACD, Bollinger Bands, and Moving Averages using the 'ta' library.
+    The indicator columns are added to the CompactBars in place.
     """
     if data is None or len(data) == 0:
         st.error("No data available to calculate indicators.")
         return data
 
     try:
-        # RSI
-        rsi = ta.momentum.RSIIndicator(close=data['Close'], window=14)
-        data['RSI'] = rsi.rsi()
-        
-        # MACD
-        macd = ta.trend.MACD(close=data['Close'], window_slow=26, window_fast=12, window_sign=9)
-        data['MACD'] = macd.macd()
-        data['MACD_Signal'] = macd.macd_signal()
-        
-        # Bollinger Bands
-        bollinger = ta.volatility.BollingerBands(close=data['Close'], window=20, window_dev=2)
-        data['Upper_Band'] = bollinger.bollinger_hband()
-        data['Middle_Band'] = bollinger.bollinger_mavg()
-        data['Lower_Band'] = bollinger.bollinger_lband()
-        
-        # Moving Averages: SMA50 and SMA200
-        sma50 = ta.trend.SMAIndicator(close=data['Close'], window=50)
-        data['SMA50'] = sma50.sma_indicator()
-        sma200 = ta.trend.SMAIndicator(close=data['Close'], window=200)
-        data['SMA200'] = sma200.sma_indicator()
-        
-        return data
+        # RSI, MACD, Bollinger Bands and the SMA50/SMA200 moving averages
+        return add_indicators(data)
     except Exception as e:
         st.error(f"Error calculating indicators: {e}")
         return data
@@ -102,43 +86,36 @@ def get_user_parameters():
     return profit_target / 100, risk_reward_ratio
 
 # Step 4: Backtest the Strategy
-def backtest_strategy(intraday_data, daily_data, profit_target, risk_reward_ratio):
+@memoize(depends=(CompactBars, TradeLog))
+def simulate_trades(intraday_data, profit_target, risk_reward_ratio):
     """
-    Perform a backtest of the strategy using both intraday and daily data.
-    Implements proper stop loss based on buy price and RRR.
-    Implements a trailing stop loss.
-    Generates a chart showing buy/sell signals with arrows.
+    Run the trading rules over intraday CompactBars that already have indicators.
+    Results are cached by the content of the bars and the parameters, so reruns with
+    unchanged inputs skip the simulation.
+    Returns the final balance, the number of trades, the open position and the TradeLog.
     """
     balance = 10000  # Initial capital
     position = 0
     buy_price = 0.0
     stop_loss = 0.0
     trailing_stop_loss = 0.0
-    trade_log = []
-    buy_signals = []
-    sell_signals = []
     num_trades = 0
 
-    # Check if intraday data is available
-    if intraday_data is None or len(intraday_data) == 0:
-        st.error("No intraday data available for backtesting.")
-        return balance, trade_log
-
-    # Calculate indicators if not already done
-    if 'RSI' not in intraday_data.columns:
-        intraday_data = calculate_indicators(intraday_data)
-    if 'RSI' not in daily_data.columns:
-        daily_data = calculate_indicators(daily_data)
-
-    # Use daily data to guide the overall trend and intraday data for trades
-    for i in range(1, len(intraday_data)):
-        current_time = intraday_data.index[i]
-        current_price = intraday_data['Close'].iloc[i]
-        current_rsi_intraday = intraday_data['RSI'].iloc[i]
-        current_rsi_daily = daily_data['RSI'].iloc[-1]  # Latest daily RSI
-
-        sma_short = intraday_data['SMA50'].iloc[i]  # Short-term moving average (50 periods)
-        sma_long = intraday_data['SMA200'].iloc[i]  # Long-term moving average (200 periods)
+    # Loop over the plain float32 columns instead of .iloc lookups
+    bars = intraday_data
+    trade_log = TradeLog(tz=bars.tz)
+    timestamps = bars.timestamps
+    closes = bars['Close'].tolist()
+    rsi_intraday = bars['RSI'].tolist()
+    sma_shorts = bars['SMA50'].tolist()  # Short-term moving average (50 periods)
+    sma_longs = bars['SMA200'].tolist()  # Long-term moving average (200 periods)
+
+    # Intraday bars drive the trades
+    for i in range(1, len(bars)):
+        current_price = closes[i]
+        current_rsi_intraday = rsi_intraday[i]
+        sma_short = sma_shorts[i]
+        sma_long = sma_longs[i]
 
         if position > 0:
             # Update Trailing Stop Loss
@@ -153,14 +130,7 @@ def backtest_strategy(intraday_data, daily_data, profit_target, risk_reward_rati
             if current_price <= active_stop_loss:
                 # Sell at stop loss
                 balance = position * current_price
-                trade_log.append({
-                    'action': 'sell',
-                    'shares': position,
-                    'price': current_price,
-                    'time': current_time,
-                    'reason': 'stop_loss'
-                })
-                sell_signals.append((current_time, current_price))
+                trade_log.append('sell', position, current_price, timestamps[i], 'stop_loss')
                 position = 0
                 buy_price = 0.0
                 stop_loss = 0.0
@@ -172,14 +142,7 @@ def backtest_strategy(intraday_data, daily_data, profit_target, risk_reward_rati
             if current_price >= buy_price * (1 + profit_target):
                 # Sell at profit target
                 balance = position * current_price
-                trade_log.append({
-                    'action': 'sell',
-                    'shares': position,
-                    'price': current_price,
-                    'time': current_time,
-                    'reason': 'profit_target'
-                })
-                sell_signals.append((current_time, current_price))
+                trade_log.append('sell', position, current_price, timestamps[i], 'profit_target')
                 position = 0
                 buy_price = 0.0
                 stop_loss = 0.0
@@ -195,25 +158,40 @@ def backtest_strategy(intraday_data, daily_data, profit_target, risk_reward_rati
             stop_loss = buy_price * (1 - (profit_target / risk_reward_ratio))
             trailing_stop_loss = 0.0  # Reset trailing stop loss
             balance = 0  # All money is invested
-            trade_log.append({
-                'action': 'buy',
-                'shares': position,
-                'price': current_price,
-                'time': current_time,
-                'reason': 'buy_signal'
-            })
-            buy_signals.append((current_time, current_price))
+            trade_log.append('buy', position, current_price, timestamps[i], 'buy_signal')
             num_trades += 1
 
     # Final balance after backtest
-    final_balance = balance if position == 0 else position * intraday_data['Close'].iloc[-1]
+    final_balance = balance if position == 0 else position * closes[-1]
+    return final_balance, num_trades, position, trade_log
+
+def backtest_strategy(intraday_data, daily_data, profit_target, risk_reward_ratio):
+    """
+    Perform a backtest of the strategy using both intraday and daily data.
+    Implements proper stop loss based on buy price and RRR.
+    Implements a trailing stop loss.
+    Generates a chart showing buy/sell signals with arrows.
+    """
+    # Check if intraday data is available
+    if intraday_data is None or len(intraday_data) == 0:
+        st.error("No intraday data available for backtesting.")
+        return 10000, []
+
+    # Calculate indicators if not already done
+    if 'RSI' not in intraday_data:
+        intraday_data = calculate_indicators(intraday_data)
+    if 'RSI' not in daily_data:
+        daily_data = calculate_indicators(daily_data)
+
+    final_balance, num_trades, position, trade_log = simulate_trades(intraday_data, profit_target, risk_reward_ratio)
 
     # Display the results of the backtest
     st.success(f"Final Balance: ${final_balance:.2f}")
     st.info(f"Number of Trades: {num_trades}")
 
-    # Display trade logs
-    for log in trade_log:
+    # Display trade logs (records are only built here, at the UI edge)
+    trade_records = trade_log.records()
+    for log in trade_records:
         action = log['action'].capitalize()
         shares = log['shares']
         price = log['price']
@@ -225,8 +203,8 @@ def backtest_strategy(intraday_data, daily_data, profit_target, risk_reward_rati
             st.write(f"{action} {shares:.2f} shares at ${price:.2f} on {time} ({reason})")
 
     # Enhanced hold messaging
-    latest_rsi_intraday = intraday_data['RSI'].iloc[-1]
-    latest_rsi_daily = daily_data['RSI'].iloc[-1]
+    latest_rsi_intraday = intraday_data['RSI'][-1]
+    latest_rsi_daily = daily_data['RSI'][-1]
     if position > 0:
         if 30 < latest_rsi_intraday < 50:
             st.warning(f"Holding: Possible Buy Signal Forming (RSI near 30) - Intraday RSI: {latest_rsi_intraday:.2f}, Daily RSI: {latest_rsi_daily:.2f}")
@@ -237,9 +215,9 @@ def backtest_strategy(intraday_data, daily_data, profit_target, risk_reward_rati
     else:
         st.info(f"All positions are closed - Intraday RSI: {latest_rsi_intraday:.2f}, Daily RSI: {latest_rsi_daily:.2f}")
 
-    # Generate a chart with buy/sell signals
-    plot_signals(intraday_data, buy_signals, sell_signals)
-    return final_balance, trade_log
+    # Generate a chart with buy/sell signals (the only place the bars become a DataFrame)
+    plot_signals(intraday_data.to_frame(), trade_log.signals('buy'), trade_log.signals('sell'))
+    return final_balance, trade_records
 
 def plot_signals(data, buy_signals, sell_signals):
     """
@@ -267,29 +245,260 @@ def plot_signals(data, buy_signals, sell_signals):
     plt.clf()  # Clear the figure after plotting to prevent overlap
 
 # Step 5: Suggest Next Trade
-def suggest_next_trade(intraday_data, daily_data):
+def evaluate_trade_signal(intraday_data, daily_data):
     """
-    Suggest the next trade (buy/sell) based on the latest indicators from both intraday and daily timeframes.
+    Apply the multi-timeframe buy/sell/hold rule to the latest intraday and daily indicators
+    of two CompactBars. Returns a dict with the signal and the values it was based on, or
+    None if there is no data.
     """
     if intraday_data is None or daily_data is None or len(intraday_data) == 0 or len(daily_data) == 0:
-        return "No data available to suggest a trade."
+        return None
 
-    latest_rsi_intraday = intraday_data['RSI'].iloc[-1]
-    latest_close_intraday = intraday_data['Close'].iloc[-1]
-    lower_band_intraday = intraday_data['Lower_Band'].iloc[-1]
-    upper_band_intraday = intraday_data['Upper_Band'].iloc[-1]
+    latest_rsi_intraday = float(intraday_data['RSI'][-1])
+    latest_close_intraday = float(intraday_data['Close'][-1])
+    lower_band_intraday = float(intraday_data['Lower_Band'][-1])
+    upper_band_intraday = float(intraday_data['Upper_Band'][-1])
 
-    latest_rsi_daily = daily_data['RSI'].iloc[-1]
-    lower_band_daily = daily_data['Lower_Band'].iloc[-1]
-    upper_band_daily = daily_data['Upper_Band'].iloc[-1]
+    latest_rsi_daily = float(daily_data['RSI'][-1])
 
     # Multi-timeframe confirmation for buy/sell decisions
     if latest_rsi_intraday < 40 and latest_close_intraday <= lower_band_intraday and latest_rsi_daily < 40:
-        return f"**Suggested Trade:** Buy at ${latest_close_intraday:.2f} (RSI: {latest_rsi_intraday:.2f} Intraday, {latest_rsi_daily:.2f} Daily)"
+        signal = 'Buy'
     elif latest_rsi_intraday > 60 and latest_close_intraday >= upper_band_intraday and latest_rsi_daily > 60:
-        return f"**Suggested Trade:** Sell at ${latest_close_intraday:.2f} (RSI: {latest_rsi_intraday:.2f} Intraday, {latest_rsi_daily:.2f} Daily)"
+        signal = 'Sell'
     else:
-        return f"**Hold** (Intraday RSI: {latest_rsi_intraday:.2f}, Daily RSI: {latest_rsi_daily:.2f})"
+        signal = 'Hold'
+
+    return {
+        'signal': signal,
+        'close': latest_close_intraday,
+        'rsi_intraday': latest_rsi_intraday,
+        'rsi_daily': latest_rsi_daily,
+        'lower_band': lower_band_intraday,
+        'upper_band': upper_band_intraday,
+        'time': intraday_data.time(-1),
+    }
+
+def suggest_next_trade(intraday_data, daily_data):
+    """
+    Suggest the next trade (buy/sell) based on the latest indicators from both intraday and daily timeframes.
+    """
+    trade = evaluate_trade_signal(intraday_data, daily_data)
+    if trade is None:
+        return "No data available to suggest a trade."
+
+    if trade['signal'] == 'Buy':
+        return f"**Suggested Trade:** Buy at ${trade['close']:.2f} (RSI: {trade['rsi_intraday']:.2f} Intraday, {trade['rsi_daily']:.2f} Daily)"
+    elif trade['signal'] == 'Sell':
+        return f"**Suggested Trade:** Sell at ${trade['close']:.2f} (RSI: {trade['rsi_intraday']:.2f} Intraday, {trade['rsi_daily']:.2f} Daily)"
+    else:
+        return f"**Hold** (Intraday RSI: {trade['rsi_intraday']:.2f}, Daily RSI: {trade['rsi_daily']:.2f})"
+
+# Step 6: Watchlist Screener
+SCREENER_SIGNAL_ORDER = {'Buy': 0, 'Sell': 1, 'Hold': 2, 'Error': 3}
+
+def _to_bars(data):
+    """
+    Downloaded OHLCV bars as CompactBars, or None if the download is empty.
+    """
+    if data is None or len(data) == 0:
+        return None
+    return CompactBars.from_frame(data, PRICE_COLUMNS)
+
+def _append_bars(cached, new_bars):
+    """
+    Append newly downloaded bars to cached CompactBars. Overlapping timestamps keep the newest
+    values, so a bar that was still forming on the previous download gets replaced.
+    """
+    if cached is None or len(cached) == 0:
+        return new_bars
+    if new_bars is None or len(new_bars) == 0:
+        return cached
+    return cached.append(new_bars)
+
+def _same_bars(cached, bars):
+    """
+    Whether a refresh left the bars unchanged: same length and same last bar.
+    """
+    return (
+        cached is not None and len(cached) == len(bars) and len(bars) > 0
+        and cached.timestamps[-1] == bars.timestamps[-1]
+        and all(np.array_equal(cached[column][-1:], bars[column][-1:], equal_nan=True) for column in bars.columns)
+    )
+
+class WatchlistScreener:
+    """
+    Evaluate the suggest_next_trade rule across a watchlist without running the backtest.
+
+    Raw bars are kept as float32 CompactBars between refreshes and each refresh only
+    downloads bars from the last cached timestamp onwards. Indicators and signals are only recomputed for symbols whose
+    bars changed; unchanged symbols keep their previous row. With a feature_store, indicators
+    for changed symbols are only computed for the newly arrived bars.
+    """
+
+    def __init__(self, tickers, interval='5m', max_workers=16, feature_store=None):
+        if interval not in INTRADAY_LOOKBACK_DAYS:
+            raise ValueError(f"Interval '{interval}' is not supported.")
+        self.interval = interval
+        self.max_workers = max_workers
+        self.feature_store = feature_store
+        self.tickers = []
+        self.last_refresh = None
+        self.last_recomputed = 0
+        self._bars = {}  # ticker -> (raw intraday CompactBars, raw daily CompactBars)
+        self._rows = {}  # ticker -> latest screener row
+        self.set_tickers(tickers)
+
+    def set_tickers(self, tickers):
+        """
+        Replace the watchlist, dropping cached state for symbols that were removed.
+        """
+        self.tickers = list(dict.fromkeys(t.strip().upper() for t in tickers if t.strip()))
+        for ticker in set(self._bars) - set(self.tickers):
+            self._bars.pop(ticker, None)
+            self._rows.pop(ticker, None)
+
+    def _download(self, ticker, cached_intraday, cached_daily):
+        """
+        Download intraday and daily bars, only fetching from the last cached bar when there is one.
+        """
+        end_date = datetime.now()
+        history = yf.Ticker(ticker).history
+
+        if cached_intraday is None:
+            intraday_start = end_date - timedelta(days=INTRADAY_LOOKBACK_DAYS[self.interval])
+        else:
+            intraday_start = cached_intraday.time(-1).to_pydatetime().replace(tzinfo=None)
+        if cached_daily is None:
+            daily_start = end_date - timedelta(days=365)
+        else:
+            daily_start = cached_daily.time(-1).to_pydatetime().replace(tzinfo=None)
+
+        intraday_data = _append_bars(cached_intraday, _to_bars(history(start=intraday_start, end=end_date, interval=self.interval)))
+        daily_data = _append_bars(cached_daily, _to_bars(history(start=daily_start, end=end_date, interval='1d')))
+
+        # Keep the cache bounded to the same lookback a fresh download would return
+        if intraday_data is not None:
+            intraday_data = intraday_data.since(pd.Timedelta(days=INTRADAY_LOOKBACK_DAYS[self.interval]))
+        if daily_data is not None:
+            daily_data = daily_data.since(pd.Timedelta(days=365))
+        return intraday_data, daily_data
+
+    def _screen_ticker(self, ticker):
+        """
+        Refresh one symbol. Returns (ticker, bars, row), where row is None if the bars did not change.
+        """
+        cached_intraday, cached_daily = self._bars.get(ticker, (None, None))
+        intraday_data, daily_data = self._download(ticker, cached_intraday, cached_daily)
+
+        if intraday_data is None or daily_data is None or len(intraday_data) == 0 or len(daily_data) == 0:
+            raise ValueError(f"No data found for {ticker} with interval '{self.interval}'.")
+
+        unchanged = _same_bars(cached_intraday, intraday_data) and _same_bars(cached_daily, daily_data)
+        if unchanged and ticker in self._rows:
+            return ticker, (intraday_data, daily_data), None
+
+        if self.feature_store is not None:
+            trade = evaluate_trade_signal(
+                self.feature_store.update(ticker, self.interval, intraday_data),
+                self.feature_store.update(ticker, '1d', daily_data),
+            )
+        else:
+            # Indicators go on slices, so the cached raw bars keep only their price columns
+            trade = evaluate_trade_signal(
+                calculate_indicators(intraday_data.slice()),
+                calculate_indicators(daily_data.slice()),
+            )
+        row = {
+            'Ticker': ticker,
+            'Signal': trade['signal'],
+            'Close': trade['close'],
+            'Intraday RSI': trade['rsi_intraday'],
+            'Daily RSI': trade['rsi_daily'],
+            # Percent distance of the close from each Bollinger band (negative = below the band)
+            'Lower Band %': (trade['close'] / trade['lower_band'] - 1) * 100,
+            'Upper Band %': (trade['close'] / trade['upper_band'] - 1) * 100,
+            'Last Bar': trade['time'],
+            'Computed At': datetime.now(),
+        }
+        return ticker, (intraday_data, daily_data), row
+
+    def refresh(self):
+        """
+        Refresh every symbol on the watchlist concurrently and return the ranked results table.
+        """
+        recomputed = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._screen_ticker, ticker): ticker for ticker in self.tickers}
+            for future in as_completed(futures):
+                ticker = futures[future]
+                try:
+                    ticker, bars, row = future.result()
+                except Exception as e:
+                    self._rows[ticker] = {'Ticker': ticker, 'Signal': 'Error', 'Error': str(e), 'Computed At': datetime.now()}
+                    continue
+                self._bars[ticker] = bars
+                if row is not None:
+                    self._rows[ticker] = row
+                    recomputed += 1
+
+        self.last_refresh = datetime.now()
+        self.last_recomputed = recomputed
+        return self.results()
+
+    def results(self):
+        """
+        Rank the latest rows: Buy signals first (most oversold first), then Sell signals
+        (most overbought first), then Hold sorted by how close the close is to either band.
+        """
+        rows = [self._rows[t] for t in self.tickers if t in self._rows]
+        if not rows:
+            return pd.DataFrame()
+
+        results = pd.DataFrame(rows)
+        if 'Intraday RSI' not in results.columns:
+            return results
+
+        band_distance = np.minimum(results['Lower Band %'].abs(), results['Upper Band %'].abs())
+        results['_order'] = results['Signal'].map(SCREENER_SIGNAL_ORDER)
+        results['_strength'] = np.select(
+            [results['Signal'] == 'Buy', results['Signal'] == 'Sell'],
+            [results['Intraday RSI'], -results['Intraday RSI']],
+            default=band_distance,
+        )
+        results = results.sort_values(['_order', '_strength'], na_position='last')
+        return results.drop(columns=['_order', '_strength']).reset_index(drop=True)
+
+def screener_page(interval):
+    """
+    Streamlit view for the watchlist screener. The screener is kept in the session state so
+    cached bars survive reruns, and the table refreshes itself on a schedule.
+    """
+    st.sidebar.markdown("---")
+    watchlist = st.sidebar.text_area("Watchlist (comma or newline separated):", value="SPY, QQQ, AAPL, XLK")
+    refresh_seconds = st.sidebar.number_input("Refresh every (seconds):", min_value=15, value=60)
+    max_workers = st.sidebar.number_input("Concurrent downloads:", min_value=1, max_value=64, value=16)
+
+    tickers = watchlist.replace(',', '\n').split('\n')
+    screener = st.session_state.get('screener')
+    if screener is None or screener.interval != interval:
+        screener = WatchlistScreener(tickers, interval=interval, max_workers=int(max_workers), feature_store=FeatureStore())
+        st.session_state['screener'] = screener
+    else:
+        screener.set_tickers(tickers)
+        screener.max_workers = int(max_workers)
+
+    @st.fragment(run_every=int(refresh_seconds))
+    def render_results():
+        with st.spinner("Screening watchlist..."):
+            results = screener.refresh()
+        st.caption(
+            f"Last refresh: {screener.last_refresh:%Y-%m-%d %H:%M:%S} - "
+            f"recomputed {screener.last_recomputed} of {len(screener.tickers)} symbols"
+        )
+        st.dataframe(results, hide_index=True)
+
+    render_results()
 
 # Main Streamlit App
 def main():
@@ -297,9 +506,16 @@ def main():
 
     st.sidebar.header("User Inputs")
 
+    mode = st.sidebar.radio("Mode:", ["Backtest", "Screener"])
+    interval = st.sidebar.selectbox("Select the interval for intraday data:", ["1m", "2m", "5m", "15m", "30m", "60m"])
+    use_archive = st.sidebar.checkbox("Use local intraday archive (extends history past Yahoo's limits)", value=False)
+
+    if mode == "Screener":
+        screener_page(interval)
+        return
+
     # User Inputs
     ticker = st.sidebar.text_input("Enter the ticker symbol for the stock (e.g., SPY, QQQ, AAPL, XLK):", value="XLK").upper()
-    interval = st.sidebar.selectbox("Select the interval for intraday data:", ["1m", "2m", "5m", "15m", "30m", "60m"])
 
     st.sidebar.markdown("---")
 
@@ -312,15 +528,23 @@ def main():
     if st.button("Run Backtest"):
         with st.spinner("Downloading data..."):
             # Download historical data for both intraday and daily timeframes
-            intraday_data, daily_data = download_data(ticker, interval)
+            intraday_data, daily_data = download_data(ticker, interval, use_archive)
         
         if intraday_data is None or daily_data is None:
             st.error("No valid data found for the specified ticker or interval.")
         else:
             with st.spinner("Calculating indicators and running backtest..."):
-                # Calculate indicators for both timeframes
-                intraday_data = calculate_indicators(intraday_data)
-                daily_data = calculate_indicators(daily_data)
+                # Calculate indicators for both timeframes, reusing the stored indicator
+                # columns and only computing the bars that are new since the last run
+                try:
+                    feature_store = FeatureStore()
+                    intraday_data = feature_store.update(ticker, interval, intraday_data)
+                    daily_data = feature_store.update(ticker, '1d', daily_data)
+                except Exception as e:
+                    st.error(f"Error calculating indicators: {e}")
+                    # Fall back to computing the indicators in memory without the store
+                    intraday_data = calculate_indicators(intraday_data)
+                    daily_data = calculate_indicators(daily_data)
 
                 # Run backtest
                 final_balance, trade_log = backtest_strategy(intraday_data, daily_data, profit_target, risk_reward_ratio)
@@ -329,12 +553,17 @@ def main():
                 next_trade = suggest_next_trade(intraday_data, daily_data)
                 st.markdown(next_trade)
 
-                # Optionally, display the dataframes
+                # Optionally, display the last bars (converted to DataFrames only for display)
                 with st.expander("Show Intraday Data"):
-                    st.dataframe(intraday_data.tail())
+                    st.caption(f"{len(intraday_data)} bars, {intraday_data.nbytes / 1024:.0f} KiB resident")
+                    st.dataframe(intraday_data.slice(-5).to_frame())
 
                 with st.expander("Show Daily Data"):
-                    st.dataframe(daily_data.tail())
+                    st.caption(f"{len(daily_data)} bars, {daily_data.nbytes / 1024:.0f} KiB resident")
+                    st.dataframe(daily_data.slice(-5).to_frame())
+
+                with st.expander("Result Cache"):
+                    st.json(default_cache().stats())
 
 if __name__ == "__main__":
     main()
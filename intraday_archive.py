@@ -0,0 +1,289 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+from datetime import datetime, timedelta
+
+# Yahoo Finance only serves intraday bars this many days back for each interval
+INTRADAY_LOOKBACK_DAYS = {
+    '1m': 7,
+    '2m': 60,
+    '5m': 60,
+    '15m': 60,
+    '30m': 60,
+    '60m': 730,
+    '1h': 730,
+}
+
+# One row per bar; timestamps are UTC nanoseconds since the epoch
+BAR_DTYPE = np.dtype([
+    ('timestamp', '<i8'),
+    ('Open', '<f8'),
+    ('High', '<f8'),
+    ('Low', '<f8'),
+    ('Close', '<f8'),
+    ('Volume', '<f8'),
+])
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+def index_to_utc_nanoseconds(index):
+    """
+    Convert a DatetimeIndex (naive indexes are taken to be in UTC) to int64 UTC nanoseconds.
+    """
+    if index.tz is None:
+        index = index.tz_localize('UTC')
+    return index.tz_convert('UTC').as_unit('ns').asi8
+
+
+def bars_to_array(data, columns=PRICE_COLUMNS):
+    """
+    Convert bars into a structured array sorted by time.
+
+    Parameters:
+    - data (DataFrame or CompactBars): Bars with Open/High/Low/Close/Volume columns and a
+      DatetimeIndex (or the epoch timestamps of CompactBars).
+    - columns (list): Columns to include as float64 fields after 'timestamp'. The default
+      gives a BAR_DTYPE array.
+
+    Returns:
+    - bars (ndarray): Structured array of bars.
+    """
+    bars = np.empty(len(data), dtype=[('timestamp', '<i8')] + [(str(column), '<f8') for column in columns])
+    bars['timestamp'] = data.timestamps if hasattr(data, 'timestamps') else index_to_utc_nanoseconds(data.index)
+    for column in columns:
+        bars[str(column)] = np.asarray(data[column], dtype='float64')
+    return bars[np.argsort(bars['timestamp'], kind='stable')]
+
+
+def array_to_bars(bars, tz='UTC'):
+    """
+    Convert a structured array with a 'timestamp' field back into a DataFrame indexed by time.
+
+    Parameters:
+    - bars (ndarray): Structured array of bars, optionally with extra columns after the prices.
+    - tz (str): Timezone of the returned index.
+
+    Returns:
+    - data (DataFrame): One column per field other than 'timestamp'.
+    """
+    index = pd.DatetimeIndex(pd.to_datetime(bars['timestamp'], unit='ns', utc=True)).tz_convert(tz)
+    columns = [name for name in bars.dtype.names if name != 'timestamp']
+    return pd.DataFrame({column: np.asarray(bars[column]) for column in columns}, index=index)
+
+
+def merge_bars(existing, new):
+    """
+    Merge two bar arrays, keeping the newest values for duplicate timestamps.
+
+    Parameters:
+    - existing (ndarray): Bars already stored.
+    - new (ndarray): Newly downloaded bars.
+
+    Returns:
+    - merged (ndarray): Sorted, de-duplicated bars.
+    """
+    combined = np.concatenate([existing, new])
+    # Reverse so np.unique keeps the last occurrence (the newer download) of each timestamp
+    reversed_combined = combined[::-1]
+    _, first = np.unique(reversed_combined['timestamp'], return_index=True)
+    return reversed_combined[first]
+
+
+class IntradayArchive:
+    """
+    Date-partitioned local store of intraday bars that grows past Yahoo's lookback limits.
+
+    Layout under the root directory:
+    - TICKER/INTERVAL/partitions/YYYY-MM-DD.npy: one trading day of bars per file.
+    - TICKER/INTERVAL/series.bin: every partition concatenated in date order, read with np.memmap.
+    - TICKER/INTERVAL/manifest.json: timezone, row count and row range of each partition in series.bin.
+
+    Writing a day again merges it with what is already stored, so re-downloading overlapping
+    ranges is idempotent. Only the tail of series.bin from the first changed day is rewritten.
+    """
+
+    def __init__(self, root='intraday_archive'):
+        self.root = root
+
+    def _directory(self, ticker, interval):
+        return os.path.join(self.root, ticker.upper(), interval)
+
+    def _partition_path(self, ticker, interval, day):
+        return os.path.join(self._directory(ticker, interval), 'partitions', f"{day}.npy")
+
+    def _read_manifest(self, ticker, interval):
+        path = os.path.join(self._directory(ticker, interval), 'manifest.json')
+        if not os.path.exists(path):
+            return {'tz': 'UTC', 'rows': 0, 'partitions': {}}
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_manifest(self, ticker, interval, manifest):
+        path = os.path.join(self._directory(ticker, interval), 'manifest.json')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def partitions(self, ticker, interval):
+        """
+        List the archived trading days for a ticker and interval, oldest first.
+        """
+        directory = os.path.join(self._directory(ticker, interval), 'partitions')
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-len('.npy')] for name in os.listdir(directory) if name.endswith('.npy'))
+
+    def write_bars(self, ticker, interval, data):
+        """
+        Append bars to the archive, one partition per trading day in the bars' own timezone.
+
+        Parameters:
+        - ticker (str): Stock ticker symbol.
+        - interval (str): Bar interval, e.g. '1m'.
+        - data (DataFrame): Bars with a DatetimeIndex and Open/High/Low/Close/Volume columns.
+
+        Returns:
+        - changed_days (list): Days whose partition was created or modified.
+        """
+        if data is None or len(data) == 0:
+            return []
+
+        os.makedirs(os.path.join(self._directory(ticker, interval), 'partitions'), exist_ok=True)
+        manifest = self._read_manifest(ticker, interval)
+        if data.index.tz is not None:
+            manifest['tz'] = str(data.index.tz)
+
+        changed_days = []
+        for day, day_data in data.groupby(data.index.date):
+            day = day.isoformat()
+            new_bars = bars_to_array(day_data)
+            path = self._partition_path(ticker, interval, day)
+            if os.path.exists(path):
+                existing = np.load(path)
+                merged = merge_bars(existing, new_bars)
+                if np.array_equal(merged, existing):
+                    continue
+            else:
+                merged = merge_bars(np.empty(0, dtype=BAR_DTYPE), new_bars)
+
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, merged)
+            os.replace(tmp_path, path)
+            changed_days.append(day)
+
+        if changed_days:
+            self._update_series(ticker, interval, manifest, min(changed_days))
+        return changed_days
+
+    def _update_series(self, ticker, interval, manifest, first_changed_day):
+        """
+        Rewrite series.bin from the first changed day onwards, keeping every earlier row in place.
+        """
+        series_path = os.path.join(self._directory(ticker, interval), 'series.bin')
+        kept = {day: span for day, span in manifest['partitions'].items() if day < first_changed_day}
+        keep_rows = sum(count for _, count in kept.values())
+
+        # If series.bin is shorter than the manifest claims (e.g. an interrupted write), rebuild it
+        if not os.path.exists(series_path) or os.path.getsize(series_path) < keep_rows * BAR_DTYPE.itemsize:
+            kept, keep_rows = {}, 0
+
+        mode = 'r+b' if os.path.exists(series_path) else 'wb'
+        with open(series_path, mode) as f:
+            f.truncate(keep_rows * BAR_DTYPE.itemsize)
+            f.seek(keep_rows * BAR_DTYPE.itemsize)
+            rows = keep_rows
+            for day in self.partitions(ticker, interval):
+                if day in kept:
+                    continue
+                bars = np.load(self._partition_path(ticker, interval, day))
+                f.write(bars.tobytes())
+                kept[day] = [rows, len(bars)]
+                rows += len(bars)
+
+        manifest['partitions'] = kept
+        manifest['rows'] = rows
+        self._write_manifest(ticker, interval, manifest)
+
+    def rebuild(self, ticker, interval):
+        """
+        Rebuild series.bin and the manifest from the partition files alone.
+        """
+        manifest = self._read_manifest(ticker, interval)
+        manifest['partitions'] = {}
+        partitions = self.partitions(ticker, interval)
+        if partitions:
+            self._update_series(ticker, interval, manifest, partitions[0])
+
+    def update(self, ticker, interval='1m'):
+        """
+        Download the newest bars and append them to the archive. The first call fetches Yahoo's
+        full lookback for the interval; later calls only fetch from the newest archived day.
+
+        Parameters:
+        - ticker (str): Stock ticker symbol.
+        - interval (str): Bar interval, e.g. '1m'.
+
+        Returns:
+        - changed_days (list): Days whose partition was created or modified.
+        """
+        if interval not in INTRADAY_LOOKBACK_DAYS:
+            raise ValueError(f"Interval '{interval}' is not supported.")
+
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=INTRADAY_LOOKBACK_DAYS[interval])
+        partitions = self.partitions(ticker, interval)
+        if partitions:
+            start_date = max(start_date, datetime.fromisoformat(partitions[-1]))
+
+        data = yf.Ticker(ticker).history(start=start_date, end=end_date, interval=interval)
+        return self.write_bars(ticker, interval, data)
+
+    def load(self, ticker, interval, start=None, end=None, as_frame=True):
+        """
+        Read the archived bars as one contiguous series backed by a memory map.
+
+        Parameters:
+        - ticker (str): Stock ticker symbol.
+        - interval (str): Bar interval, e.g. '1m'.
+        - start (str or datetime, optional): First timestamp to include.
+        - end (str or datetime, optional): Timestamps before this are included.
+        - as_frame (bool): Return a DataFrame; otherwise the memory-mapped structured array.
+
+        Returns:
+        - bars (DataFrame or ndarray): Archived bars, or None if nothing is archived.
+        """
+        manifest = self._read_manifest(ticker, interval)
+        series_path = os.path.join(self._directory(ticker, interval), 'series.bin')
+        if manifest['rows'] == 0 or not os.path.exists(series_path):
+            return None
+        if os.path.getsize(series_path) < manifest['rows'] * BAR_DTYPE.itemsize:
+            self.rebuild(ticker, interval)
+            manifest = self._read_manifest(ticker, interval)
+
+        bars = np.memmap(series_path, dtype=BAR_DTYPE, mode='r', shape=(manifest['rows'],))
+        timestamps = bars['timestamp']
+        lo, hi = 0, len(bars)
+        if start is not None:
+            lo = np.searchsorted(timestamps, to_utc_nanoseconds(start, manifest['tz']), side='left')
+        if end is not None:
+            hi = np.searchsorted(timestamps, to_utc_nanoseconds(end, manifest['tz']), side='left')
+        bars = bars[lo:hi]
+
+        if as_frame:
+            return array_to_bars(bars, tz=manifest['tz'])
+        return bars
+
+
+def to_utc_nanoseconds(value, tz):
+    """
+    Convert a date or timestamp (naive values are taken to be in the archive's timezone) to UTC nanoseconds.
+    """
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize(tz)
+    return timestamp.tz_convert('UTC').as_unit('ns').value
@@ -0,0 +1,176 @@
+# parameter_search.py
+
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cup_and_handle_pattern_recognition import (
+    CupAndHandleParams,
+    DEFAULT_CUP_AND_HANDLE_PARAMS,
+    fetch_stock_data,
+    label_with_structures,
+    precompute_window_structures,
+)
+from shared_price_arrays import SharedPricePlane, attach
+
+# Window structures and reference labels, set once per worker process
+_structures = None
+_reference_labels = None
+
+
+def parameter_grid(**ranges):
+    """
+    Build every combination of detector thresholds, keeping the defaults for any not given.
+
+    Parameters:
+    - **ranges: Lists of values keyed by CupAndHandleParams field name,
+      e.g. min_depth=[0.05, 0.1], max_depth=[0.4, 0.5].
+
+    Returns:
+    - param_sets (list): CupAndHandleParams for every consistent combination.
+    """
+    fields = CupAndHandleParams._fields
+    unknown = set(ranges) - set(fields)
+    if unknown:
+        raise ValueError(f"Unknown detector parameters: {', '.join(sorted(unknown))}")
+
+    values = [ranges.get(field, [getattr(DEFAULT_CUP_AND_HANDLE_PARAMS, field)]) for field in fields]
+    param_sets = []
+    for combination in itertools.product(*values):
+        params = CupAndHandleParams(*combination)
+        if params.min_cup_length > params.max_cup_length:
+            continue
+        if params.min_handle_length > params.max_handle_length:
+            continue
+        if params.min_depth > params.max_depth:
+            continue
+        param_sets.append(params)
+    return param_sets
+
+
+def load_reference_set(csv_path, window_size=60):
+    """
+    Load a labelled reference set of windows.
+
+    The CSV has one row per window with columns 'ticker', 'start_date' (first bar of the
+    window, 'YYYY-MM-DD') and 'label' (1 for a cup and handle, 0 otherwise).
+
+    Parameters:
+    - csv_path (str): Path of the reference CSV.
+    - window_size (int): Size of the window.
+
+    Returns:
+    - close_windows (ndarray): Close prices, one row per window.
+    - labels (ndarray): Reference labels.
+    """
+    reference = pd.read_csv(csv_path, parse_dates=['start_date'])
+    close_windows = []
+    labels = []
+    for ticker, rows in reference.groupby('ticker'):
+        # Pad the end date so the last window has enough trading days after its start
+        end_date = rows['start_date'].max() + pd.Timedelta(days=window_size * 2)
+        data = fetch_stock_data(ticker, rows['start_date'].min().strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+        close = data['Close'].values.ravel()
+        for start_date, label in zip(rows['start_date'], rows['label']):
+            start = data.index.searchsorted(start_date)
+            if start + window_size > len(close):
+                print(f"Skipping {ticker} window starting {start_date:%Y-%m-%d}: not enough data.")
+                continue
+            close_windows.append(close[start:start + window_size])
+            labels.append(int(label))
+    return np.array(close_windows), np.array(labels)
+
+
+def _init_worker(structure_descriptors, labels_descriptor):
+    global _structures, _reference_labels
+    _structures = {key: attach(descriptor) for key, descriptor in structure_descriptors.items()}
+    _reference_labels = attach(labels_descriptor)
+
+
+def _evaluate_parameters(params):
+    """
+    Label the reference windows with one parameter set and score it against the reference labels.
+    """
+    start = time.perf_counter()
+    predicted = label_with_structures(_structures, params)
+    seconds = time.perf_counter() - start
+
+    true_positives = int(np.sum((predicted == 1) & (_reference_labels == 1)))
+    false_positives = int(np.sum((predicted == 1) & (_reference_labels == 0)))
+    false_negatives = int(np.sum((predicted == 0) & (_reference_labels == 1)))
+    precision = true_positives / (true_positives + false_positives) if true_positives + false_positives else 0.0
+    recall = true_positives / (true_positives + false_negatives) if true_positives + false_negatives else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+    result = params._asdict()
+    result.update({
+        'positives': int(predicted.sum()),
+        'true_positives': true_positives,
+        'false_positives': false_positives,
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'seconds': seconds,
+    })
+    return result
+
+
+def search_parameters(close_windows, labels, param_sets, max_workers=None):
+    """
+    Evaluate many detector parameter sets in parallel against a labelled reference set.
+
+    The prefix minima and handle range structures are computed once and published to shared
+    memory, so workers read them without a copy and every parameter set only costs a
+    vectorised pass over them.
+
+    Parameters:
+    - close_windows (ndarray): Close prices, one row per reference window.
+    - labels (ndarray): Reference labels (1 for pattern, 0 for no pattern).
+    - param_sets (list): CupAndHandleParams to evaluate.
+    - max_workers (int, optional): Number of worker processes. Defaults to the CPU count.
+
+    Returns:
+    - results (DataFrame): One row per parameter set with label counts, precision, recall,
+      F1 and labelling time, best F1 first.
+    """
+    start = time.perf_counter()
+    structures = precompute_window_structures(close_windows, max(p.max_handle_length for p in param_sets))
+    print(f"Precomputed window structures for {len(close_windows)} windows in {time.perf_counter() - start:.2f}s.")
+
+    max_workers = max_workers or os.cpu_count()
+    chunksize = max(1, len(param_sets) // (max_workers * 4))
+    with SharedPricePlane() as plane:
+        structure_descriptors = {key: plane.publish_array(key, array) for key, array in structures.items()}
+        labels_descriptor = plane.publish_array('labels', np.asarray(labels))
+        del structures
+
+        initargs = (structure_descriptors, labels_descriptor)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=initargs) as executor:
+            results = list(executor.map(_evaluate_parameters, param_sets, chunksize=chunksize))
+
+    results = pd.DataFrame(results)
+    return results.sort_values(['f1', 'precision'], ascending=False).reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    csv_path = input("Enter the path of the labelled reference CSV (ticker,start_date,label): ")
+    close_windows, labels = load_reference_set(csv_path)
+    print(f"Loaded {len(labels)} reference windows ({labels.sum()} patterns).")
+
+    param_sets = parameter_grid(
+        min_cup_length=[5, 10, 15],
+        max_cup_length=[40, 50, 60],
+        min_handle_length=[3, 5, 8],
+        max_handle_length=[15, 20, 25],
+        min_depth=[0.05, 0.1, 0.15],
+        max_depth=[0.35, 0.5],
+        handle_max_retrace=[0.3, 0.5, 0.7],
+    )
+    start = time.perf_counter()
+    results = search_parameters(close_windows, labels, param_sets)
+    print(f"Evaluated {len(param_sets)} parameter sets in {time.perf_counter() - start:.1f}s.")
+    print(results.head(10).to_string(index=False))
@@ -0,0 +1,394 @@
+# pattern_similarity_index.py
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from tensorflow.keras import models
+
+from cup_and_handle_pattern_recognition import create_windows, fetch_stock_data, preprocess_windows
+from result_cache import fingerprint
+
+DEFAULT_HORIZONS = (5, 20, 60)
+VECTOR_KINDS = ('prices', 'embedding')
+DEFAULT_MODEL_PATH = 'cup_and_handle_cnn_model.keras'
+
+
+def cnn_embeddings(model, X, batch_size=1024):
+    """
+    Embed windows with the CNN's penultimate Dense(50) layer.
+
+    Parameters:
+    - model (Model): Trained pattern CNN.
+    - X (ndarray): Preprocessed windows.
+    - batch_size (int): Prediction batch size.
+
+    Returns:
+    - embeddings (ndarray): float32 array of shape (samples, 50).
+    """
+    embedding_model = models.Model(inputs=model.inputs, outputs=model.layers[-2].output)
+    return embedding_model.predict(X, batch_size=batch_size, verbose=0).astype('float32')
+
+
+def model_fingerprint(model):
+    """
+    Hash of a model's architecture and weights, identifying the embedding space it produces.
+    """
+    return fingerprint(model).hexdigest()
+
+
+def forward_returns(close, end_positions, horizons=DEFAULT_HORIZONS):
+    """
+    Return after each window end over each horizon, NaN where the series is too short.
+
+    Parameters:
+    - close (ndarray): Close prices of the whole series.
+    - end_positions (ndarray): Bar position of each window's last bar.
+    - horizons (tuple): Forward horizons in bars.
+
+    Returns:
+    - returns (ndarray): float32 array of shape (windows, horizons).
+    """
+    close = np.asarray(close, dtype='float64')
+    returns = np.full((len(end_positions), len(horizons)), np.nan, dtype='float32')
+    for h, horizon in enumerate(horizons):
+        available = end_positions + horizon < len(close)
+        ends = end_positions[available]
+        returns[available, h] = close[ends + horizon] / close[ends] - 1
+    return returns
+
+
+class PatternSimilarityIndex:
+    """
+    Nearest-neighbour index over normalised price windows or CNN embeddings.
+
+    Vectors are L2-normalised and kept in one compact float32 matrix, so similarity is a dot
+    product (for z-scored windows this ranks the same as Euclidean distance). Each row also
+    stores its ticker, window end time, bar position and forward returns.
+
+    Approximate queries use random-hyperplane LSH: every table hashes a vector to n_bits
+    signs, rows are kept sorted by hash code, and a query reranks the union of its buckets
+    (plus buckets one bit away when that is too small) exactly. Appends only add rows; the
+    sorted order is rebuilt lazily on the next query.
+
+    vector_kind records whether rows are normalised prices ('prices') or CNN embeddings
+    ('embedding'); use vectorize() to turn query windows into the same kind of vector. An
+    embedding index also records the fingerprint of the model its rows were embedded with
+    and refuses windows embedded by any other model, since fine-tuning moves the embedding
+    space.
+    """
+
+    def __init__(self, dim, n_tables=8, n_bits=14, horizons=DEFAULT_HORIZONS, seed=0, vector_kind='prices',
+                 model_fingerprint=None):
+        if vector_kind not in VECTOR_KINDS:
+            raise ValueError(f"Vector kind must be one of {', '.join(VECTOR_KINDS)}.")
+        self.dim = dim
+        self.vector_kind = vector_kind
+        self.model_fingerprint = model_fingerprint
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.horizons = tuple(horizons)
+        self.seed = seed
+        self._hyperplanes = np.random.default_rng(seed).standard_normal((n_tables, n_bits, dim)).astype('float32')
+        self._bit_weights = (1 << np.arange(n_bits)).astype('int64')
+
+        self.tickers = []
+        self._size = 0
+        self._vectors = np.empty((0, dim), dtype='float32')
+        self._ticker_ids = np.empty(0, dtype='int32')
+        self._end_times = np.empty(0, dtype='int64')
+        self._end_positions = np.empty(0, dtype='int32')
+        self._returns = np.empty((0, len(self.horizons)), dtype='float32')
+        self._codes = np.empty((n_tables, 0), dtype='int64')
+        self._sorted = None
+
+    def __len__(self):
+        return self._size
+
+    def _hash(self, vectors, chunk_size=65536):
+        """
+        LSH codes of shape (n_tables, len(vectors)).
+        """
+        codes = np.empty((self.n_tables, len(vectors)), dtype='int64')
+        for start in range(0, len(vectors), chunk_size):
+            bits = np.einsum('tbd,nd->tnb', self._hyperplanes, vectors[start:start + chunk_size]) > 0
+            codes[:, start:start + chunk_size] = bits.astype('int64') @ self._bit_weights
+        return codes
+
+    def vectorize(self, X, model=None):
+        """
+        Turn preprocessed windows into the kind of vector this index holds.
+
+        Parameters:
+        - X (ndarray): Preprocessed windows from preprocess_windows.
+        - model (Model, optional): Pattern CNN; required for an embedding index.
+
+        Returns:
+        - vectors (ndarray): Vectors of shape (samples, dim).
+        """
+        if self.vector_kind == 'embedding':
+            if model is None:
+                raise ValueError("This index holds CNN embeddings; pass the model to embed the windows.")
+            if self.model_fingerprint is not None and model_fingerprint(model) != self.model_fingerprint:
+                raise ValueError("This index was embedded with a different model; rebuild it with the current model.")
+            return cnn_embeddings(model, X)
+        return np.asarray(X, dtype='float32').reshape(len(X), -1)
+
+    def _grow(self, extra):
+        """
+        Make room for extra rows, doubling capacity so repeated appends stay amortised O(1).
+        """
+        needed = self._size + extra
+        capacity = len(self._vectors)
+        if needed <= capacity:
+            return
+        capacity = max(needed, 2 * capacity, 1024)
+
+        def resize(array, shape):
+            grown = np.empty(shape, dtype=array.dtype)
+            grown[:self._size] = array[:self._size]
+            return grown
+
+        self._vectors = resize(self._vectors, (capacity, self.dim))
+        self._ticker_ids = resize(self._ticker_ids, (capacity,))
+        self._end_times = resize(self._end_times, (capacity,))
+        self._end_positions = resize(self._end_positions, (capacity,))
+        self._returns = resize(self._returns, (capacity, len(self.horizons)))
+        codes = np.empty((self.n_tables, capacity), dtype='int64')
+        codes[:, :self._size] = self._codes[:, :self._size]
+        self._codes = codes
+
+    def add(self, vectors, ticker, end_times, end_positions, returns):
+        """
+        Append windows of one ticker to the index.
+
+        Parameters:
+        - vectors (ndarray): Window vectors (samples, dim); flattened if 3-D.
+        - ticker (str): Ticker the windows come from.
+        - end_times (DatetimeIndex): Time of each window's last bar.
+        - end_positions (ndarray): Bar position of each window's last bar in the ticker's series.
+        - returns (ndarray): Forward returns (samples, len(horizons)).
+        """
+        vectors = np.asarray(vectors, dtype='float32').reshape(len(vectors), -1)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got {vectors.shape[1]}.")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms > 0, norms, 1)
+
+        if ticker not in self.tickers:
+            self.tickers.append(ticker)
+        n = len(vectors)
+        self._grow(n)
+        rows = slice(self._size, self._size + n)
+        self._vectors[rows] = vectors
+        self._ticker_ids[rows] = self.tickers.index(ticker)
+        self._end_times[rows] = pd.DatetimeIndex(end_times).as_unit('ns').asi8
+        self._end_positions[rows] = end_positions
+        self._returns[rows] = returns
+        self._codes[:, rows] = self._hash(vectors)
+        self._size += n
+        self._sorted = None
+
+    def add_series(self, ticker, data, window_size=60, model=None):
+        """
+        Index every window of a price series that is not indexed yet, and fill in forward
+        returns of earlier windows that have become known since they were added.
+
+        Parameters:
+        - ticker (str): Stock ticker symbol.
+        - data (DataFrame): Price data of the whole series, starting where the indexed series started.
+        - window_size (int): Size of the window.
+        - model (Model, optional): Pattern CNN; required for an index of CNN embeddings
+          (vector_kind 'embedding'), whose rows are the Dense(50) embeddings of the windows.
+
+        Returns:
+        - added (int): Number of windows appended.
+        """
+        close = data['Close'].values.ravel()
+        indexed = np.flatnonzero(self._ticker_ids[:self._size] == self.tickers.index(ticker)) if ticker in self.tickers else np.empty(0, dtype=int)
+
+        if len(indexed) > 0:
+            missing = indexed[np.isnan(self._returns[indexed]).any(axis=1)]
+            self._returns[missing] = forward_returns(close, self._end_positions[missing], self.horizons)
+            first_window = int(self._end_positions[indexed].max()) - window_size + 2
+        else:
+            first_window = 0
+
+        windows = create_windows(data.iloc[first_window:], window_size)
+        if len(windows) == 0:
+            return 0
+        if self.vector_kind == 'embedding' and self._size == 0 and model is not None:
+            # The first rows fix the embedding space of the index
+            self.model_fingerprint = model_fingerprint(model)
+        vectors = self.vectorize(preprocess_windows(windows), model)
+        end_positions = np.arange(len(windows)) + first_window + window_size - 1
+        self.add(vectors, ticker, data.index[end_positions], end_positions, forward_returns(close, end_positions, self.horizons))
+        return len(windows)
+
+    def _sort_codes(self):
+        order = np.argsort(self._codes[:, :self._size], axis=1, kind='stable')
+        self._sorted = (order, np.take_along_axis(self._codes[:, :self._size], order, axis=1))
+
+    def _candidates(self, query, min_candidates):
+        if self._sorted is None:
+            self._sort_codes()
+        order, sorted_codes = self._sorted
+        codes = self._hash(query[None])[:, 0]
+
+        probes = [codes]
+        # Multi-probe: also look one bit away when the exact buckets are too small
+        probes += [codes ^ (1 << bit) for bit in range(self.n_bits)]
+        candidates = []
+        count = 0
+        for probe in probes:
+            for table in range(self.n_tables):
+                lo, hi = np.searchsorted(sorted_codes[table], [probe[table], probe[table] + 1])
+                candidates.append(order[table, lo:hi])
+                count += hi - lo
+            if count >= min_candidates:
+                break
+        return np.unique(np.concatenate(candidates))
+
+    def query(self, vector, k=10, exact=False, exclude=None, min_separation=None, min_candidates=2000):
+        """
+        Find the k most similar indexed windows.
+
+        Parameters:
+        - vector (ndarray): Query vector of the index's kind (see vectorize()).
+        - k (int): Number of neighbours to return.
+        - exact (bool): Scan every row instead of the LSH buckets.
+        - exclude (tuple, optional): (ticker, end_time) of the query itself, to leave out
+          windows overlapping it.
+        - min_separation (int, optional): Minimum bar distance between results from the same
+          ticker, so overlapping copies of one formation are only returned once.
+          Defaults to the vector dimension (the window size for price windows).
+        - min_candidates (int): Keep probing neighbouring buckets until this many candidates.
+
+        Returns:
+        - neighbours (DataFrame): Ticker, window end, similarity and forward returns, most similar first.
+        """
+        vector = np.asarray(vector, dtype='float32').ravel()
+        if len(vector) != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got {len(vector)}.")
+        vector = vector / (np.linalg.norm(vector) or 1)
+        min_separation = self.dim if min_separation is None else min_separation
+
+        rows = np.arange(self._size) if exact else self._candidates(vector, min_candidates)
+        similarity = self._vectors[rows] @ vector
+
+        # Each returned window suppresses fewer than 2 * min_separation others from its ticker
+        # (and so does the excluded query), so this many top rows always yield k results
+        keep = min(len(rows), (k + 1) * 2 * max(min_separation, 1))
+        top = np.argpartition(-similarity, keep - 1)[:keep] if keep < len(rows) else np.arange(len(rows))
+        top = top[np.argsort(-similarity[top], kind='stable')]
+        ranked, similarity = rows[top], similarity[top]
+
+        excluded_ticker = excluded_position = None
+        if exclude is not None and exclude[0] in self.tickers:
+            excluded_ticker = self.tickers.index(exclude[0])
+            excluded_end = pd.Timestamp(exclude[1]).as_unit('ns').value
+            matches = np.flatnonzero((self._ticker_ids[:self._size] == excluded_ticker) & (self._end_times[:self._size] == excluded_end))
+            if len(matches) > 0:
+                excluded_position = int(self._end_positions[matches[0]])
+
+        selected, scores = [], []
+        taken = {}  # ticker id -> end positions already returned
+        if excluded_position is not None:
+            taken[excluded_ticker] = [excluded_position]
+        for row, score in zip(ranked, similarity):
+            ticker_id = self._ticker_ids[row]
+            position = int(self._end_positions[row])
+            if any(abs(p - position) < min_separation for p in taken.get(ticker_id, [])):
+                continue
+            taken.setdefault(ticker_id, []).append(position)
+            selected.append(row)
+            scores.append(score)
+            if len(selected) == k:
+                break
+
+        selected = np.array(selected, dtype=int)
+        neighbours = pd.DataFrame({
+            'ticker': [self.tickers[i] for i in self._ticker_ids[selected]],
+            'end_date': pd.to_datetime(self._end_times[selected]),
+            'similarity': np.array(scores, dtype='float32'),
+        })
+        for h, horizon in enumerate(self.horizons):
+            neighbours[f'return_{horizon}'] = self._returns[selected, h]
+        return neighbours
+
+    def save(self, path):
+        """
+        Save the index to a directory of .npy files plus a JSON header.
+        """
+        os.makedirs(path, exist_ok=True)
+        n = self._size
+        np.save(os.path.join(path, 'vectors.npy'), self._vectors[:n])
+        np.save(os.path.join(path, 'ticker_ids.npy'), self._ticker_ids[:n])
+        np.save(os.path.join(path, 'end_times.npy'), self._end_times[:n])
+        np.save(os.path.join(path, 'end_positions.npy'), self._end_positions[:n])
+        np.save(os.path.join(path, 'returns.npy'), self._returns[:n])
+        with open(os.path.join(path, 'index.json'), 'w') as f:
+            json.dump({
+                'dim': self.dim,
+                'n_tables': self.n_tables,
+                'n_bits': self.n_bits,
+                'horizons': list(self.horizons),
+                'seed': self.seed,
+                'vector_kind': self.vector_kind,
+                'model_fingerprint': self.model_fingerprint,
+                'tickers': self.tickers,
+            }, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an index saved with save(). The hash codes are recomputed from the vectors.
+        """
+        with open(os.path.join(path, 'index.json')) as f:
+            header = json.load(f)
+        index = cls(header['dim'], header['n_tables'], header['n_bits'], header['horizons'], header['seed'],
+                    header['vector_kind'], header['model_fingerprint'])
+        index.tickers = header['tickers']
+        index._vectors = np.load(os.path.join(path, 'vectors.npy'))
+        index._ticker_ids = np.load(os.path.join(path, 'ticker_ids.npy'))
+        index._end_times = np.load(os.path.join(path, 'end_times.npy'))
+        index._end_positions = np.load(os.path.join(path, 'end_positions.npy'))
+        index._returns = np.load(os.path.join(path, 'returns.npy'))
+        index._size = len(index._vectors)
+        index._codes = index._hash(index._vectors) if index._size else np.empty((index.n_tables, 0), dtype='int64')
+        return index
+
+
+if __name__ == '__main__':
+    index_path = 'pattern_similarity_index'
+    window_size = 60
+    tickers = input("Enter the tickers to index, separated by commas (e.g., AAPL, NVDA, MSFT): ")
+    tickers = [t.strip().upper() for t in tickers.split(',') if t.strip()]
+
+    if os.path.exists(index_path):
+        index = PatternSimilarityIndex.load(index_path)
+        vector_kind = index.vector_kind
+    else:
+        index = None
+        vector_kind = input("Index normalised prices or CNN embeddings? (prices/embedding): ").strip().lower() or 'prices'
+        if vector_kind not in VECTOR_KINDS:
+            raise ValueError(f"Vector kind must be one of {', '.join(VECTOR_KINDS)}.")
+
+    model = models.load_model(DEFAULT_MODEL_PATH) if vector_kind == 'embedding' else None
+    if index is not None and vector_kind == 'embedding' and index.model_fingerprint != model_fingerprint(model):
+        # The model was retrained since the index was built: re-embed every indexed ticker
+        print(f"'{DEFAULT_MODEL_PATH}' changed since the index was built; rebuilding it.")
+        tickers = index.tickers + [ticker for ticker in tickers if ticker not in index.tickers]
+        index = None
+    if index is None:
+        dim = model.layers[-2].output.shape[-1] if vector_kind == 'embedding' else window_size
+        index = PatternSimilarityIndex(dim, vector_kind=vector_kind)
+
+    end_date = pd.Timestamp.today().strftime('%Y-%m-%d')
+    for ticker in tickers:
+        data = fetch_stock_data(ticker, '2010-01-01', end_date)
+        added = index.add_series(ticker, data, window_size, model)
+        print(f"Indexed {added} new windows for {ticker}.")
+    index.save(index_path)
+    print(f"Saved index with {len(index)} windows to '{index_path}'.")
@@ -0,0 +1,359 @@
+# result_cache.py
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CACHE_ROOT = 'result_cache'
+DEFAULT_MEMORY_LIMIT = 256 * 1024 ** 2  # In-process tier
+DEFAULT_DISK_LIMIT = 2 * 1024 ** 3  # On-disk tier
+
+# Source hashes of the modules memoized functions are defined in or depend on: path -> (mtime, hash)
+_source_hashes = {}
+_default_cache = None
+
+
+def fingerprint(value, hasher=None):
+    """
+    Hash a function argument by content. Arrays and DataFrames are hashed by their values and
+    index, models by their architecture and weights, containers element by element and
+    anything else by pickle.
+
+    Parameters:
+    - value: The value to hash.
+    - hasher (hashlib object, optional): Hasher to update. A new one is created if omitted.
+
+    Returns:
+    - hasher (hashlib object): The updated hasher.
+    """
+    if hasher is None:
+        hasher = hashlib.blake2b(digest_size=20)
+
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        hasher.update(type(value).__name__.encode())
+        hasher.update(repr(list(value.columns) if isinstance(value, pd.DataFrame) else value.name).encode())
+        _fingerprint_index(value.index, hasher)
+        values = value.to_numpy()
+        if values.dtype.kind in 'biufcmM':
+            # Raw bytes are much cheaper than hash_pandas_object for the many small window frames
+            hasher.update(str(values.dtype).encode())
+            hasher.update(np.ascontiguousarray(values).tobytes())
+        else:
+            hasher.update(pd.util.hash_pandas_object(value, index=False).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        hasher.update(b'array')
+        hasher.update(repr((value.dtype.descr, value.shape)).encode())
+        hasher.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        # Namedtuples (e.g. CupAndHandleParams) also carry their type name
+        hasher.update(type(value).__name__.encode())
+        hasher.update(str(len(value)).encode())
+        for item in value:
+            fingerprint(item, hasher)
+    elif isinstance(value, dict):
+        hasher.update(b'dict')
+        for key in sorted(value, key=repr):
+            hasher.update(repr(key).encode())
+            fingerprint(value[key], hasher)
+    elif hasattr(value, 'get_weights'):
+        # Keras model: same architecture and weights give the same predictions
+        hasher.update(b'model')
+        _fingerprint_architecture(value, hasher)
+        for weights in value.get_weights():
+            fingerprint(np.asarray(weights), hasher)
+    elif hasattr(value, 'model_path'):
+        # TFLitePatternClassifier and similar wrappers around a model file
+        hasher.update(b'model_file')
+        with open(value.model_path, 'rb') as f:
+            hasher.update(f.read())
+    else:
+        hasher.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    return hasher
+
+
+def _fingerprint_architecture(model, hasher):
+    """
+    Hash a Keras model's input shape and layer configs. Names are left out, since Keras
+    numbers the model and its layers afresh (sequential_1, conv1d_2, ...) every time an
+    identical model is rebuilt or reloaded.
+    """
+    hasher.update(type(model).__name__.encode())
+    hasher.update(repr([tuple(tensor.shape) for tensor in getattr(model, 'inputs', None) or []]).encode())
+    for layer in getattr(model, 'layers', []):
+        if hasattr(layer, 'layers'):
+            _fingerprint_architecture(layer, hasher)
+            continue
+        config = layer.get_config()
+        config.pop('name', None)
+        hasher.update(type(layer).__name__.encode())
+        hasher.update(json.dumps(config, sort_keys=True, default=str).encode())
+
+
+def _fingerprint_index(index, hasher):
+    if isinstance(index, pd.DatetimeIndex):
+        hasher.update(str(index.tz).encode())
+        hasher.update(index.asi8.tobytes())
+    else:
+        hasher.update(pd.util.hash_pandas_object(index).to_numpy().tobytes())
+
+
+def _file_hash(path):
+    mtime = os.path.getmtime(path)
+    cached = _source_hashes.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            cached = (mtime, hashlib.blake2b(f.read(), digest_size=20).hexdigest())
+        _source_hashes[path] = cached
+    return cached[1]
+
+
+def source_version(fn, depends=()):
+    """
+    Hash of the source file a function is defined in, so editing that module invalidates its
+    cached results. Helpers imported from other modules are not covered unless listed in
+    depends.
+
+    Parameters:
+    - fn (callable): The memoized function.
+    - depends (tuple): Modules, classes or functions whose source files are hashed as well.
+
+    Returns:
+    - version (str): Hash of the source files.
+    """
+    try:
+        hashes = [_file_hash(fn.__code__.co_filename)]
+        hashes += [_file_hash(inspect.getfile(dependency)) for dependency in depends]
+    except (OSError, TypeError):
+        return fn.__code__.co_code.hex()
+    return hashes[0] if len(hashes) == 1 else hashlib.blake2b(''.join(hashes).encode(), digest_size=20).hexdigest()
+
+
+class ResultCache:
+    """
+    Content-addressed two-tier cache for expensive results such as window labels, prediction
+    vectors and backtest summaries.
+
+    Results are keyed on a hash of the function name, its code version and its arguments, so
+    a result is reused whenever the same data slice is processed with the same parameters by
+    the same code, across Streamlit reruns and (through the disk tier) across restarts. Both
+    tiers evict the least recently used entries once they exceed their size limit. Results
+    from the in-process tier are shared between callers, so treat them as read-only.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_ROOT, memory_limit=DEFAULT_MEMORY_LIMIT, disk_limit=DEFAULT_DISK_LIMIT):
+        self.root = root
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self._memory = OrderedDict()  # key -> (value, size), least recently used first
+        self._memory_bytes = 0
+        self._disk = None  # key -> size, least recently used first; scanned on first use
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(['memory_hits', 'disk_hits', 'misses', 'memory_evictions', 'disk_evictions'], 0)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + '.pkl')
+
+    def _scan_disk(self):
+        """
+        Index the entries already on disk, oldest access first.
+        """
+        entries = []
+        if os.path.isdir(self.root):
+            for directory, _, files in os.walk(self.root):
+                for name in files:
+                    if name.endswith('.pkl'):
+                        stat = os.stat(os.path.join(directory, name))
+                        entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        self._disk = OrderedDict((key, size) for _, key, size in sorted(entries))
+        self._disk_bytes = sum(self._disk.values())
+
+    def get(self, key):
+        """
+        Look up a result.
+
+        Returns:
+        - found (bool): Whether the key was cached.
+        - value: The cached result, or None.
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return True, self._memory[key][0]
+            if self._disk is None:
+                self._scan_disk()
+            on_disk = key in self._disk
+
+        if on_disk:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    payload = f.read()
+                os.utime(path)  # Mark as recently used for eviction after a restart
+            except FileNotFoundError:
+                payload = None  # Evicted by another process sharing the directory
+            if payload is not None:
+                value = pickle.loads(payload)
+                with self._lock:
+                    self._disk.move_to_end(key)
+                    self._stats['disk_hits'] += 1
+                    self._store_in_memory(key, value, len(payload))
+                return True, value
+
+        with self._lock:
+            self._disk.pop(key, None)
+            self._stats['misses'] += 1
+        return False, None
+
+    def put(self, key, value):
+        """
+        Store a result in both tiers.
+        """
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._disk is None:
+                self._scan_disk()
+            self._disk_bytes += len(payload) - self._disk.pop(key, 0)
+            self._disk[key] = len(payload)
+            self._evict_disk()
+            self._store_in_memory(key, value, len(payload))
+
+    def _store_in_memory(self, key, value, size):
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[1]
+        if size > self.memory_limit:
+            return
+        self._memory[key] = (value, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_limit:
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+            self._stats['memory_evictions'] += 1
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.disk_limit and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self._stats['disk_evictions'] += 1
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def key(self, name, version, args, kwargs):
+        """
+        Content-addressed key for one call.
+        """
+        hasher = hashlib.blake2b(digest_size=20)
+        hasher.update(name.encode())
+        hasher.update(version.encode())
+        fingerprint(args, hasher)
+        fingerprint(kwargs, hasher)
+        return hasher.hexdigest()
+
+    def memoize(self, fn=None, *, version='', depends=()):
+        """
+        Decorator that caches a function's results by the content of its arguments.
+
+        Parameters:
+        - fn (callable): Function to wrap.
+        - version (str): Extra version tag, for changes the source hash cannot see (e.g. a
+          dependency upgrade).
+        - depends (tuple): Modules, classes or functions from other files the function relies
+          on; editing their source invalidates its results too.
+
+        Returns:
+        - wrapper (callable): The memoized function.
+        """
+        if fn is None:
+            return functools.partial(self.memoize, version=version, depends=depends)
+
+        name = f"{fn.__module__}.{fn.__qualname__}"
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            # Bind defaults so f(x) and f(x, params=default) share an entry
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = self.key(name, source_version(fn, depends) + version, bound.args, bound.kwargs)
+            found, value = self.get(key)
+            if not found:
+                value = fn(*args, **kwargs)
+                self.put(key, value)
+            return value
+
+        return wrapper
+
+    def stats(self):
+        """
+        Hit/miss statistics and tier sizes.
+
+        Returns:
+        - stats (dict): Hits per tier, misses, hit rate, evictions per tier, and entries and
+          bytes held by each tier.
+        """
+        with self._lock:
+            if self._disk is None:
+                self._scan_disk()
+            stats = dict(self._stats)
+            lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+            stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+            stats['memory_entries'] = len(self._memory)
+            stats['memory_bytes'] = self._memory_bytes
+            stats['disk_entries'] = len(self._disk)
+            stats['disk_bytes'] = self._disk_bytes
+        return stats
+
+    def clear(self):
+        """
+        Drop every cached result from both tiers.
+        """
+        with self._lock:
+            if self._disk is None:
+                self._scan_disk()
+            for key in self._disk:
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass
+            self._disk.clear()
+            self._disk_bytes = 0
+            self._memory.clear()
+            self._memory_bytes = 0
+
+
+def default_cache():
+    """
+    Process-wide cache shared by the apps. Imported modules survive Streamlit reruns, so its
+    in-process tier does too.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResultCache()
+    return _default_cache
+
+
+def memoize(fn=None, *, version='', depends=()):
+    """
+    Memoize a function with the default cache (see ResultCache.memoize).
+    """
+    if fn is None:
+        return functools.partial(memoize, version=version, depends=depends)
+    return default_cache().memoize(fn, version=version, depends=depends)
@@ -0,0 +1,234 @@
+# shared_price_arrays.py
+
+import atexit
+import os
+import uuid
+import weakref
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from cup_and_handle_pattern_recognition import DEFAULT_CUP_AND_HANDLE_PARAMS
+from intraday_archive import bars_to_array
+
+# Block names start with this prefix and the owner's pid, so blocks left behind by a
+# killed owner can be found and removed later
+BLOCK_PREFIX = 'uhuru'
+
+# What a worker needs to attach to a published array: the shared memory block name, the
+# numpy dtype descriptor, the array shape and, for price frames, the first and last bar
+# time in UTC nanoseconds (None for plain arrays)
+SharedArrayDescriptor = namedtuple('SharedArrayDescriptor', ['name', 'dtype', 'shape', 'index_start', 'index_end'])
+
+# Blocks attached by this (worker) process, kept open for reuse across tasks
+_attached = {}
+
+
+class SharedPricePlane:
+    """
+    Publish price and indicator arrays once into shared memory so worker processes can read
+    them as zero-copy NumPy views instead of receiving pickled DataFrames with every task.
+
+    The plane owns its blocks: it unlinks them on close(), when used as a context manager,
+    when it is garbage collected and at interpreter exit. Workers only attach and never unlink, so a crashed worker
+    leaks nothing; blocks left by a killed owner are removed by cleanup_stale_blocks().
+    """
+
+    def __init__(self):
+        self.descriptors = {}
+        self._blocks = {}
+        # The finalizer holds the blocks, not the plane, so a dropped plane can be collected
+        weakref.finalize(self, _release_blocks, self._blocks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def publish_array(self, key, array, index_start=None, index_end=None):
+        """
+        Copy an array into a new shared memory block.
+
+        Parameters:
+        - key (str): Name the array is published under (e.g. a ticker).
+        - array (ndarray): Array to share; structured dtypes are supported.
+        - index_start (int, optional): First bar time in UTC nanoseconds.
+        - index_end (int, optional): Last bar time in UTC nanoseconds.
+
+        Returns:
+        - descriptor (SharedArrayDescriptor): Picklable handle for workers.
+        """
+        if key in self._blocks:
+            self.unpublish(key)
+
+        array = np.ascontiguousarray(array)
+        name = f"{BLOCK_PREFIX}_{os.getpid()}_{uuid.uuid4().hex[:12]}"
+        block = shared_memory.SharedMemory(name=name, create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+
+        descriptor = SharedArrayDescriptor(
+            name=block.name,
+            dtype=np.lib.format.dtype_to_descr(array.dtype),
+            shape=array.shape,
+            index_start=index_start,
+            index_end=index_end,
+        )
+        self._blocks[key] = block
+        self.descriptors[key] = descriptor
+        return descriptor
+
+    def publish_frame(self, key, data, columns=None):
+        """
+        Publish a ticker's OHLCV and indicator columns as one structured array.
+
+        Parameters:
+        - key (str): Name the frame is published under, usually the ticker.
+        - data (DataFrame): Price data with a DatetimeIndex.
+        - columns (list, optional): Numeric columns to include. Defaults to all numeric columns.
+
+        Returns:
+        - descriptor (SharedArrayDescriptor): Picklable handle for workers.
+        """
+        if columns is None:
+            columns = [column for column in data.columns if pd.api.types.is_numeric_dtype(data[column])]
+        array = bars_to_array(data, columns)
+        index_start = int(array['timestamp'][0]) if len(array) else None
+        index_end = int(array['timestamp'][-1]) if len(array) else None
+        return self.publish_array(key, array, index_start, index_end)
+
+    def unpublish(self, key):
+        """
+        Release and unlink one published block.
+        """
+        block = self._blocks.pop(key)
+        self.descriptors.pop(key, None)
+        _release_block(block)
+
+    def close(self):
+        """
+        Release and unlink every published block.
+        """
+        for key in list(self._blocks):
+            self.unpublish(key)
+
+
+def _release_block(block):
+    block.close()
+    try:
+        block.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _release_blocks(blocks):
+    """
+    Release and unlink every block a plane still owns (its finalizer).
+    """
+    while blocks:
+        _, block = blocks.popitem()
+        _release_block(block)
+
+
+def attach(descriptor):
+    """
+    Attach to a published array from a worker process, reusing the mapping across tasks.
+
+    Parameters:
+    - descriptor (SharedArrayDescriptor): Handle from SharedPricePlane.
+
+    Returns:
+    - array (ndarray): Read-only zero-copy view of the shared array.
+    """
+    block = _attached.get(descriptor.name)
+    if block is None:
+        block = shared_memory.SharedMemory(name=descriptor.name)
+        _attached[descriptor.name] = block
+    array = np.ndarray(descriptor.shape, dtype=np.lib.format.descr_to_dtype(descriptor.dtype), buffer=block.buf)
+    array.flags.writeable = False
+    return array
+
+
+def detach_all():
+    """
+    Close every block this process attached to (without unlinking them).
+    """
+    while _attached:
+        _, block = _attached.popitem()
+        try:
+            block.close()
+        except BufferError:
+            # A view into the block is still alive; the mapping goes away with the process
+            pass
+
+
+atexit.register(detach_all)
+
+
+def cleanup_stale_blocks(shm_dir='/dev/shm'):
+    """
+    Unlink shared memory blocks left behind by owners that no longer run (e.g. killed by the OS).
+
+    Returns:
+    - removed (list): Names of the removed blocks.
+    """
+    if not os.path.isdir(shm_dir):
+        return []
+
+    removed = []
+    for name in os.listdir(shm_dir):
+        parts = name.split('_')
+        if len(parts) != 3 or parts[0] != BLOCK_PREFIX or not parts[1].isdigit():
+            continue
+        pid = int(parts[1])
+        if pid == os.getpid():
+            continue
+        try:
+            os.kill(pid, 0)
+            continue  # Owner is still running
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            continue  # Owned by a live process of another user
+        try:
+            block = shared_memory.SharedMemory(name=name)
+            block.close()
+            block.unlink()
+            removed.append(name)
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def _label_shared_series(task):
+    """
+    Worker: label every window of one published series with the chunked pipeline.
+    """
+    from chunked_pipeline import iter_window_chunks
+
+    key, descriptor, window_size, params = task
+    bars = attach(descriptor)
+    labels = [chunk_labels for _, chunk_labels, _ in iter_window_chunks(bars, window_size, params=params, feature_column='Close')]
+    return key, np.concatenate(labels) if labels else np.empty(0, dtype=int)
+
+
+def label_published_series(plane, window_size=60, params=DEFAULT_CUP_AND_HANDLE_PARAMS, max_workers=None):
+    """
+    Label the windows of every series published on a plane across a process pool. Each task
+    sends only a descriptor; workers read the prices straight from shared memory.
+
+    Parameters:
+    - plane (SharedPricePlane): Plane with one published frame per ticker.
+    - window_size (int): Size of the window.
+    - params (CupAndHandleParams): Detector thresholds.
+    - max_workers (int, optional): Number of worker processes. Defaults to the CPU count.
+
+    Returns:
+    - labels (dict): Ticker -> array of window labels.
+    """
+    tasks = [(key, descriptor, window_size, params) for key, descriptor in plane.descriptors.items()]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return dict(executor.map(_label_shared_series, tasks))
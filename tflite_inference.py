@@ -0,0 +1,178 @@
+# tflite_inference.py
+
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from tensorflow.keras import models
+
+QUANTIZATIONS = ('float32', 'float16', 'int8')
+
+
+def export_tflite(model, path, quantization='float32', calibration_windows=None, calibration_samples=500):
+    """
+    Convert a trained Keras CNN to a TFLite model file.
+
+    Parameters:
+    - model (Model): Trained Keras model.
+    - path (str): Output .tflite path.
+    - quantization (str): 'float32' (no quantization), 'float16' (float16 weights) or
+      'int8' (full integer post-training quantization; inputs and outputs stay float32).
+    - calibration_windows (ndarray): Preprocessed windows used to calibrate int8 activation
+      ranges. Required for 'int8'.
+    - calibration_samples (int): Maximum number of calibration windows to use.
+
+    Returns:
+    - size (int): Size of the exported model in bytes.
+    """
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Quantization must be one of {', '.join(QUANTIZATIONS)}.")
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantization == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        if calibration_windows is None or len(calibration_windows) == 0:
+            raise ValueError("int8 quantization needs calibration_windows.")
+        rng = np.random.default_rng(0)
+        sample = rng.choice(len(calibration_windows), size=min(calibration_samples, len(calibration_windows)), replace=False)
+        calibration = np.asarray(calibration_windows, dtype='float32')[np.sort(sample)]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([window[None]] for window in calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    tflite_model = converter.convert()
+    with open(path, 'wb') as f:
+        f.write(tflite_model)
+    return len(tflite_model)
+
+
+class TFLitePatternClassifier:
+    """
+    Batched CPU inference for an exported pattern CNN through the TFLite interpreter.
+
+    predict() follows the Keras signature and returns probabilities of shape (n, 1), so an
+    instance can be passed anywhere a Keras model is used for prediction, e.g.
+    predict_on_new_data.
+    """
+
+    def __init__(self, model_path, batch_size=256, num_threads=None):
+        self.model_path = model_path
+        self.batch_size = batch_size
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads or os.cpu_count())
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._allocated_shape = None
+
+    def _allocate(self, window_size, features):
+        shape = (self.batch_size, window_size, features)
+        if self._allocated_shape != shape:
+            self.interpreter.resize_tensor_input(self._input['index'], list(shape))
+            self.interpreter.allocate_tensors()
+            self._allocated_shape = shape
+
+    def predict(self, X, verbose=0):
+        """
+        Predict pattern probabilities in float32 batches of batch_size windows.
+
+        Parameters:
+        - X (ndarray): Preprocessed windows (samples, time_steps, features).
+        - verbose (int): Ignored; accepted for compatibility with Keras.
+
+        Returns:
+        - probabilities (ndarray): Probabilities of shape (samples, 1).
+        """
+        X = np.asarray(X, dtype='float32')
+        self._allocate(X.shape[1], X.shape[2])
+        probabilities = np.empty((len(X), 1), dtype='float32')
+
+        # The last batch is zero-padded so the interpreter never has to be resized
+        batch = np.zeros(self._allocated_shape, dtype='float32')
+        for start in range(0, len(X), self.batch_size):
+            chunk = X[start:start + self.batch_size]
+            batch[:len(chunk)] = chunk
+            self.interpreter.set_tensor(self._input['index'], batch)
+            self.interpreter.invoke()
+            probabilities[start:start + len(chunk)] = self.interpreter.get_tensor(self._output['index'])[:len(chunk)]
+        return probabilities
+
+
+def benchmark_inference(keras_model, X, tflite_paths, y=None, batch_sizes=(1, 32, 256, 1024), num_threads=None, repeats=3):
+    """
+    Compare TFLite variants with the Keras model on accuracy drift, throughput and latency.
+
+    Parameters:
+    - keras_model (Model): Trained Keras model used as the reference.
+    - X (ndarray): Preprocessed windows to run.
+    - tflite_paths (dict): Variant name -> .tflite path, e.g. {'int8': 'model_int8.tflite'}.
+    - y (ndarray, optional): True labels, to report accuracy as well as agreement with Keras.
+    - batch_sizes (tuple): Batch sizes to time.
+    - num_threads (int, optional): Interpreter threads. Defaults to the CPU count.
+    - repeats (int): Timed passes per batch size; the fastest is reported.
+
+    Returns:
+    - results (DataFrame): One row per variant and batch size with label agreement and
+      maximum probability difference versus Keras, accuracy, windows per second and
+      mean latency per batch in milliseconds.
+    """
+    X = np.asarray(X, dtype='float32')
+    reference = keras_model.predict(X, verbose=0)
+    reference_labels = (reference > 0.5).astype("int32")
+
+    rows = []
+    variants = [('keras', None)] + list(tflite_paths.items())
+    for name, path in variants:
+        for batch_size in batch_sizes:
+            if path is None:
+                predict = lambda X_: keras_model.predict(X_, batch_size=batch_size, verbose=0)
+            else:
+                predict = TFLitePatternClassifier(path, batch_size=batch_size, num_threads=num_threads).predict
+
+            probabilities = predict(X)  # Warm-up pass, also used for the drift metrics
+            seconds = min(_time(predict, X) for _ in range(repeats))
+            labels = (probabilities > 0.5).astype("int32")
+
+            rows.append({
+                'variant': name,
+                'batch_size': batch_size,
+                'model_bytes': os.path.getsize(path) if path is not None else np.nan,
+                'label_agreement': float(np.mean(labels == reference_labels)),
+                'max_prob_diff': float(np.max(np.abs(probabilities - reference))),
+                'accuracy': float(np.mean(labels.ravel() == np.asarray(y).ravel())) if y is not None else np.nan,
+                'windows_per_second': len(X) / seconds,
+                'latency_ms': seconds / int(np.ceil(len(X) / batch_size)) * 1000,
+            })
+    return pd.DataFrame(rows)
+
+
+def _time(predict, X):
+    start = time.perf_counter()
+    predict(X)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    from cup_and_handle_pattern_recognition import create_windows, fetch_stock_data, label_windows, preprocess_windows
+
+    model_path = 'cup_and_handle_cnn_model.keras'
+    ticker = input("Enter the stock ticker symbol to calibrate and benchmark on (e.g., AAPL, NVDA): ")
+    window_size = 60
+
+    model = models.load_model(model_path)
+    data = fetch_stock_data(ticker, '2010-01-01', pd.Timestamp.today().strftime('%Y-%m-%d'))
+    windows = create_windows(data, window_size)
+    X = preprocess_windows(windows)
+    y = label_windows(windows)
+
+    tflite_paths = {}
+    for quantization in QUANTIZATIONS:
+        path = f"cup_and_handle_cnn_model_{quantization}.tflite"
+        size = export_tflite(model, path, quantization=quantization, calibration_windows=X)
+        tflite_paths[quantization] = path
+        print(f"Exported {path} ({size / 1024:.1f} KiB).")
+
+    print(benchmark_inference(model, X, tflite_paths, y=y).to_string(index=False))
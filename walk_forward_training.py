@@ -0,0 +1,311 @@
+# walk_forward_training.py
+
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from tensorflow.keras import callbacks, models
+
+from cup_and_handle_pattern_recognition import (
+    build_cnn_model,
+    create_windows,
+    fetch_stock_data,
+    label_windows,
+    preprocess_windows,
+)
+from evaluation_harness import StreamingBinaryMetrics, iter_batches, stream_evaluate
+from overlap_sampler import DEFAULT_SAMPLING, BalancedBatches, overlap_aware_indices, purged_time_split
+
+DEFAULT_THRESHOLD = 0.5  # Decision threshold of a model trained on the natural class ratio
+
+
+def _state_path(checkpoint_path):
+    return checkpoint_path + '.json'
+
+
+def load_training_state(checkpoint_path):
+    """
+    Load the walk-forward state stored next to a model checkpoint.
+
+    Parameters:
+    - checkpoint_path (str): Path of the Keras model checkpoint.
+
+    Returns:
+    - state (dict): {'cutoffs': {ticker: last bar date trained on}, 'threshold': decision
+      threshold of the model}.
+    """
+    path = _state_path(checkpoint_path)
+    if not os.path.exists(path):
+        return {'cutoffs': {}, 'threshold': DEFAULT_THRESHOLD}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_training_state(checkpoint_path, state):
+    """
+    Save the walk-forward state next to a model checkpoint.
+    """
+    path = _state_path(checkpoint_path)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def decision_threshold(checkpoint_path):
+    """
+    Probability above which a window counts as a pattern for the model at checkpoint_path:
+    0.5, or the threshold calibrated on the validation slice when it was trained with
+    class-balanced batches.
+    """
+    return load_training_state(checkpoint_path)['threshold']
+
+
+def _fit(model, X, y, epochs, patience, batch_size, validation_fraction, sampling=None, target_precision=None):
+    """
+    Fit on windows in time order with early stopping. The validation set is the most recent
+    part of the windows, with overlapping and embargoed windows purged from the training
+    side. With sampling, near-duplicate training windows are dropped and batches can be
+    class-balanced.
+
+    Class-balanced batches shift the predicted probabilities towards the positive class, so
+    the decision threshold is then calibrated on the validation slice: the threshold that
+    reaches target_precision with the highest recall, or the one with the best F1.
+
+    Returns:
+    - history (History): Keras training history.
+    - train_windows (int): Number of windows actually trained on.
+    - threshold (float): Calibrated decision threshold, or None when batches were not
+      balanced or the validation slice holds no usable positives.
+    """
+    embargo = sampling.embargo if sampling is not None else 0
+    train_indices, validation_indices = purged_time_split(len(y), X.shape[1], validation_fraction, embargo)
+    if sampling is not None:
+        validation_indices = validation_indices[::sampling.positive_gap]
+    # Decided on the strided validation set, so it still holds at least one full batch
+    use_validation = len(validation_indices) >= batch_size and len(train_indices) > 0
+    if not use_validation:
+        train_indices = np.arange(len(y))
+
+    if sampling is not None:
+        train_indices = train_indices[overlap_aware_indices(y[train_indices], sampling.negative_stride, sampling.positive_gap)]
+
+    early_stopping = callbacks.EarlyStopping(
+        monitor='val_loss' if use_validation else 'loss',
+        patience=patience,
+        restore_best_weights=True,
+    )
+    validation_data = (X[validation_indices], y[validation_indices]) if use_validation else None
+
+    train_labels = y[train_indices]
+    threshold = None
+    if sampling is not None and sampling.balance_classes and 0 < train_labels.sum() < len(train_labels):
+        history = model.fit(
+            BalancedBatches(X, y, train_indices, batch_size),
+            epochs=epochs,
+            validation_data=validation_data,
+            callbacks=[early_stopping],
+            verbose=0
+        )
+        if use_validation:
+            metrics, _ = stream_evaluate(model, iter_batches(X[validation_indices], y[validation_indices], 1024))
+            operating_point = metrics.threshold_for_precision(target_precision) if target_precision is not None else None
+            if operating_point is None:
+                operating_point = metrics.threshold_for_best_f1()
+            if operating_point is not None:
+                threshold = operating_point['threshold']
+    else:
+        history = model.fit(
+            X[train_indices], train_labels,
+            epochs=epochs,
+            batch_size=batch_size,
+            validation_data=validation_data,
+            callbacks=[early_stopping],
+            verbose=0
+        )
+    return history, len(train_indices), threshold
+
+
+def walk_forward_train(data, X, y, window_size=60, ticker='default',
+                       checkpoint_path='cup_and_handle_cnn_model.keras', initial_cutoff=None,
+                       step_size=63, max_epochs=20, fine_tune_epochs=5, patience=3,
+                       batch_size=32, validation_fraction=0.15, sampling=None, target_precision=None,
+                       evaluation_batch_size=1024, verbose=True):
+    """
+    Train the CNN walk-forward: advance a time cutoff in steps, fine-tune on the windows that
+    became available since the previous cutoff and evaluate on the next out-of-sample slice.
+
+    The model is warm-started from checkpoint_path when it exists, and the last bar trained on
+    for each ticker is stored next to it, so a later call only fine-tunes on new windows.
+    Training windows end before the cutoff and test windows start at or after it, so no
+    test window shares a bar with a training window. Test slices are scored at the model's
+    decision threshold (see decision_threshold), which is recalibrated on each step's
+    validation slice when sampling balances the batches. They are streamed through
+    evaluation_harness, and their counts are pooled across steps; with a target precision,
+    every step logs the threshold the out-of-sample predictions so far calibrate to.
+
+    Parameters:
+    - data (DataFrame): Stock data the windows were created from.
+    - X (ndarray): Preprocessed windows from preprocess_windows, in time order.
+    - y (ndarray): Labels from label_windows.
+    - window_size (int): Size of the window.
+    - ticker (str): Key under which the last trained bar is stored in the checkpoint state.
+    - checkpoint_path (str): Keras model file to warm-start from and save to after every step.
+    - initial_cutoff (str, optional): Date of the first cutoff when training from scratch.
+      Defaults to 60% of the way through the data.
+    - step_size (int): Number of bars the cutoff advances per step (~one quarter of daily bars).
+    - max_epochs (int): Epoch limit when no checkpoint exists yet.
+    - fine_tune_epochs (int): Epoch limit for each warm-started step.
+    - patience (int): Early-stopping patience in epochs.
+    - batch_size (int): Training batch size.
+    - validation_fraction (float): Most recent fraction of each step's windows used for early stopping.
+    - sampling (SamplingParams, optional): Overlap-aware sampling of the training windows
+      (see overlap_sampler.py). None, the default, trains on every window.
+    - target_precision (float, optional): Precision to calibrate the operating threshold for
+      on the pooled out-of-sample predictions, and the decision threshold for on the
+      validation slice when batches are balanced (the best-F1 threshold otherwise).
+    - evaluation_batch_size (int): Batch size the test slices are streamed in.
+    - verbose (bool): Print one line per step.
+
+    Returns:
+    - model (Model): The trained Keras model.
+    - log (DataFrame): One row per step with cutoff, window counts (available and actually
+      trained on), epochs, wall time, decision threshold, test metrics at that threshold,
+      ROC AUC, average precision and,
+      with a target precision, the calibrated threshold and its pooled precision and recall.
+    """
+    num_windows = len(X)
+    state = load_training_state(checkpoint_path)
+    model = models.load_model(checkpoint_path) if os.path.exists(checkpoint_path) else None
+
+    # Cutoffs are bar positions: training uses windows ending before the cutoff
+    last_trained = state['cutoffs'].get(ticker)
+    if last_trained is not None:
+        trained_until = int(data.index.searchsorted(pd.Timestamp(last_trained), side='right'))
+        cutoffs = list(range(trained_until + step_size, len(data), step_size))
+    else:
+        trained_until = 0
+        if initial_cutoff is not None:
+            first_cutoff = int(data.index.searchsorted(pd.Timestamp(initial_cutoff)))
+        else:
+            first_cutoff = int(len(data) * 0.6)
+        cutoffs = list(range(max(first_cutoff, window_size), len(data), step_size))
+    if trained_until < len(data):
+        cutoffs.append(len(data))
+
+    log = []
+    out_of_sample = StreamingBinaryMetrics()
+    for cutoff in cutoffs:
+        train_start = max(0, trained_until - window_size + 1)
+        train_end = max(0, min(cutoff - window_size + 1, num_windows))
+        if train_end <= train_start:
+            continue
+
+        warm_start = model is not None
+        if model is None:
+            model = build_cnn_model((X.shape[1], X.shape[2]))
+
+        step_start = time.perf_counter()
+        history, sampled_windows, threshold = _fit(
+            model, X[train_start:train_end], y[train_start:train_end],
+            epochs=fine_tune_epochs if warm_start else max_epochs,
+            patience=patience,
+            batch_size=batch_size,
+            validation_fraction=validation_fraction,
+            sampling=sampling,
+            target_precision=target_precision,
+        )
+        train_seconds = time.perf_counter() - step_start
+
+        if sampling is not None and sampling.balance_classes:
+            # Keep the previous calibration when this step's validation slice could not provide one
+            if threshold is not None:
+                state['threshold'] = threshold
+        else:
+            state['threshold'] = DEFAULT_THRESHOLD
+        model.save(checkpoint_path)
+        state['cutoffs'][ticker] = data.index[cutoff - 1].isoformat()
+        save_training_state(checkpoint_path, state)
+        trained_until = cutoff
+
+        # Out-of-sample slice: windows that start within the next step
+        test_start, test_end = cutoff, min(cutoff + step_size, num_windows)
+        entry = {
+            'cutoff': data.index[cutoff - 1],
+            'warm_start': warm_start,
+            'train_windows': train_end - train_start,
+            'sampled_windows': sampled_windows,
+            'epochs': len(history.history['loss']),
+            'train_seconds': train_seconds,
+            'test_windows': max(0, test_end - test_start),
+            'threshold': state['threshold'],
+            'test_positives': np.nan,
+            'test_accuracy': np.nan,
+            'test_precision': np.nan,
+            'test_recall': np.nan,
+            'test_roc_auc': np.nan,
+            'test_average_precision': np.nan,
+            'calibrated_threshold': np.nan,
+            'calibrated_precision': np.nan,
+            'calibrated_recall': np.nan,
+        }
+        if test_end > test_start:
+            metrics, _ = stream_evaluate(model, iter_batches(X[test_start:test_end], y[test_start:test_end], evaluation_batch_size))
+            out_of_sample.merge(metrics)
+            summary = metrics.summary(state['threshold'])
+            entry['test_positives'] = int(metrics.positive_counts.sum())
+            entry['test_accuracy'] = summary['accuracy']
+            entry['test_precision'] = summary['precision']
+            entry['test_recall'] = summary['recall']
+            entry['test_roc_auc'] = metrics.roc_auc()
+            entry['test_average_precision'] = metrics.average_precision()
+        if target_precision is not None and out_of_sample.positive_counts.sum() > 0:
+            operating_point = out_of_sample.threshold_for_precision(target_precision)
+            if operating_point is not None:
+                entry['calibrated_threshold'] = operating_point['threshold']
+                entry['calibrated_precision'] = operating_point['precision']
+                entry['calibrated_recall'] = operating_point['recall']
+        log.append(entry)
+
+        if verbose:
+            print(
+                f"Cutoff {entry['cutoff']:%Y-%m-%d}: trained on {entry['sampled_windows']} of {entry['train_windows']} windows "
+                f"({'warm start' if warm_start else 'from scratch'}, {entry['epochs']} epochs) in "
+                f"{train_seconds:.1f}s; next {entry['test_windows']} windows at threshold {entry['threshold']:.3f}: "
+                f"accuracy {entry['test_accuracy']:.3f}, precision {entry['test_precision']:.3f}, "
+                f"recall {entry['test_recall']:.3f}, ROC AUC {entry['test_roc_auc']:.3f}"
+                + (f"; calibrated threshold {entry['calibrated_threshold']:.3f}" if target_precision is not None else "")
+            )
+
+    return model, pd.DataFrame(log)
+
+
+if __name__ == '__main__':
+    ticker = input("Enter the stock ticker symbol (e.g., AAPL, NVDA): ")
+    target_precision = float(input("Enter the target precision to calibrate the threshold for (e.g., 0.9): "))
+    # Off by default: it trains faster but has not matched full training on validation quality
+    use_sampling = input("Use overlap-aware sampling with class-balanced batches? (y/N): ").strip().lower() == 'y'
+    window_size = 60
+
+    data = fetch_stock_data(ticker, '2010-01-01', pd.Timestamp.today().strftime('%Y-%m-%d'))
+    windows = create_windows(data, window_size)
+    labels = label_windows(windows)
+    X = preprocess_windows(windows)
+
+    sampling = DEFAULT_SAMPLING._replace(balance_classes=True) if use_sampling else None
+    model, log = walk_forward_train(data, X, labels, window_size, ticker=ticker, sampling=sampling,
+                                    target_precision=target_precision)
+    if len(log) == 0:
+        print("Model is already up to date.")
+    else:
+        print(f"\nTotal training time: {log['train_seconds'].sum():.1f}s over {len(log)} steps, "
+              f"on {log['sampled_windows'].sum()} of {log['train_windows'].sum()} windows.")
+        calibrated = log.dropna(subset=['calibrated_threshold'])
+        if len(calibrated) > 0:
+            last = calibrated.iloc[-1]
+            print(f"Out-of-sample threshold for precision {target_precision}: {last['calibrated_threshold']:.3f} "
+                  f"(precision {last['calibrated_precision']:.3f}, recall {last['calibrated_recall']:.3f}).")
+        else:
+            print(f"No threshold reaches a precision of {target_precision} out of sample.")